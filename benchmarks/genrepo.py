@@ -0,0 +1,123 @@
+"""Builds synthetic git repositories for the benchmarks.
+
+The repo gets a `main` branch holding the base files and a `branch` branch
+with `commits` commits on top. Each commit edits a `churn` fraction of the
+files, and renames or deletes files with the given probabilities. Content
+is fed through `git fast-import`, so even large repos take seconds to build.
+"""
+import os
+import random
+import subprocess
+from typing import Dict, List
+
+import click
+
+WORDS = ("alpha", "beta", "gamma", "delta", "return", "self", "value", "index",
+         "if", "else", "for", "while", "data", "None", "True", "result")
+
+class _Generator:
+    def __init__(self, seed: int, lines: int) -> None:
+        self.random = random.Random(seed)
+        self.lines = lines
+        self._next_id = 0
+
+    def line(self) -> str:
+        self._next_id += 1
+        words = self.random.choices(WORDS, k=self.random.randint(2, 8))
+        indent = "    " * self.random.randint(0, 3)
+        return f"{indent}{' '.join(words)}  # {self._next_id}"
+
+    def file(self) -> List[str]:
+        return [self.line() for _ in range(self.lines)]
+
+    def edit(self, content: List[str]) -> List[str]:
+        """Replaces, inserts and deletes a few blocks of lines."""
+        content = list(content)
+        for _ in range(self.random.randint(1, 4)):
+            start = self.random.randint(0, len(content))
+            size = self.random.randint(1, 10)
+            action = self.random.random()
+            if action < 0.4:
+                content[start:start + size] = [self.line() for _ in range(size)]
+            elif action < 0.8:
+                content[start:start] = [self.line() for _ in range(size)]
+            else:
+                del content[start:start + size]
+        return content
+
+def make_repo(path: str, commits: int, files: int, lines: int, churn: float = 0.1,
+              rename: float = 0.01, delete: float = 0.005, seed: int = 0) -> None:
+    """Creates a git repository at `path` with the shape described above."""
+    os.makedirs(path, exist_ok=True)
+    subprocess.run(["git", "init", "-q", "-b", "main", path], check=True)
+
+    gen = _Generator(seed, lines)
+    tree: Dict[str, List[str]] = {f"src/file_{i:04}.py": gen.file() for i in range(files)}
+    stream: List[bytes] = []
+
+    def commit(ref: str, mark: int, message: str, changes: List[bytes]) -> None:
+        stream.append(f"commit {ref}\nmark :{mark}\n".encode())
+        stream.append(b"committer Bench <bench@example.com> 1700000000 +0000\n")
+        stream.append(_data(message.encode()))
+        if mark > 1:
+            stream.append(f"from :{mark - 1}\n".encode())
+        stream.extend(changes)
+
+    commit("refs/heads/main", 1, "Base files",
+           [_modify(name, content) for name, content in tree.items()])
+
+    next_file = files
+    for commit_no in range(commits):
+        changes: List[bytes] = []
+        for name in sorted(tree):
+            if gen.random.random() >= churn:
+                continue
+            action = gen.random.random()
+            if action < delete and len(tree) > 1:
+                del tree[name]
+                changes.append(f"D {name}\n".encode())
+            elif action < delete + rename:
+                new_name = f"src/renamed_{next_file:04}.py"
+                next_file += 1
+                tree[new_name] = gen.edit(tree.pop(name))
+                changes.append(f"D {name}\n".encode())
+                changes.append(_modify(new_name, tree[new_name]))
+            else:
+                tree[name] = gen.edit(tree[name])
+                changes.append(_modify(name, tree[name]))
+        if not changes:
+            # Every commit changes something
+            name = gen.random.choice(sorted(tree))
+            tree[name] = gen.edit(tree[name])
+            changes.append(_modify(name, tree[name]))
+        commit("refs/heads/branch", commit_no + 2, f"Commit {commit_no}", changes)
+
+    subprocess.run(["git", "-C", path, "fast-import", "--quiet"],
+                   input=b"".join(stream), check=True)
+    subprocess.run(["git", "-C", path, "checkout", "-q", "branch"], check=True)
+
+def _modify(name: str, content: List[str]) -> bytes:
+    return f"M 100644 inline {name}\n".encode() + _data("".join(
+        f"{line}\n" for line in content).encode())
+
+def _data(data: bytes) -> bytes:
+    return f"data {len(data)}\n".encode() + data + b"\n"
+
+@click.command()
+@click.argument('path', type=click.Path(exists=False))
+@click.option('--commits', type=int, default=20, show_default=True)
+@click.option('--files', type=int, default=50, show_default=True)
+@click.option('--lines', type=int, default=500, show_default=True)
+@click.option('--churn', type=float, default=0.1, show_default=True,
+              help='Chance that a commit changes each file')
+@click.option('--rename', type=float, default=0.01, show_default=True,
+              help='Chance that a changed file is renamed')
+@click.option('--delete', type=float, default=0.005, show_default=True,
+              help='Chance that a changed file is deleted')
+@click.option('--seed', type=int, default=0, show_default=True)
+def main(path: str, commits: int, files: int, lines: int, churn: float,
+         rename: float, delete: float, seed: int) -> None:
+    make_repo(path, commits, files, lines, churn, rename, delete, seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Times rediff's load, alignment and rendering on a synthetic repository.
+
+    python benchmarks/run.py -o after.json --compare before.json
+
+Results are written as JSON. With --compare, each timing is checked against
+an earlier run, and the exit status is 1 if any got slower than --threshold.
+"""
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Optional
+
+import click
+
+from genrepo import make_repo
+from rediff.cli import ByteSize
+from rediff.db import AlignedHistory, DiffCache, GitData
+from rediff.linediff import ALGORITHMS
+
+Results = Dict[str, Dict[str, Any]]
+
+def _time(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+def _check_placeholders(gd: GitData) -> None:
+    """Fails if any file came back as a placeholder: its timings would
+    measure no work."""
+    placeholders = [fh for fh in gd.file_histories.values() if fh.placeholder]
+    if placeholders:
+        raise click.ClickException(
+            f"{len(placeholders)} of {len(gd.file_histories)} files are placeholders, "
+            f"e.g. {placeholders[0].file_name}: {placeholders[0].placeholder}; "
+            "raise --max-file-size or use fewer --lines")
+
+def bench_gitdata(repo_path: str, repeat: int, streaming: bool, jobs: int,
+                  max_file_size: Optional[int]) -> Results:
+    results: Results = {}
+
+    def load() -> GitData:
+        return GitData(repo_path, "main", lazy=True, streaming=streaming, jobs=jobs,
+                       max_file_size=max_file_size)
+
+    results["GitData.load"] = _time(load, repeat)
+
+    def materialize() -> None:
+        gd = load()
+        gd.prefill_diffs()
+        for fh in gd.file_histories.values():
+            fh.materialize()
+
+    results["GitData.load+materialize"] = _time(materialize, repeat)
+
+    gd = load()
+    gd.prefill_diffs()
+    histories = list(gd.file_histories.values())
+    for fh in histories:
+        for fc in fh.file_commits.values():
+            fc.load()
+
+    def get_all_patches() -> None:
+        for fh in histories:
+            fh._aligned = None
+            fh.get_all_patches()
+
+    def get_total_length() -> None:
+        for fh in histories:
+            fh._aligned = None
+            fh.get_total_length()
+
+    results["FileHistory.get_all_patches"] = _time(get_all_patches, repeat)
+    results["FileHistory.get_total_length"] = _time(get_total_length, repeat)
+
+    def get_content() -> None:
+        for fh in histories:
+            all_patches = fh.get_all_patches()
+            total_length = fh.get_total_length()
+            for fc in fh.file_commits.values():
+                fc.get_content(all_patches, total_length)
+
+    results["FileCommit.get_content"] = _time(get_content, repeat)
+    _check_placeholders(gd)
+    return results
+
+def bench_diff(repo_path: str, repeat: int) -> Results:
+    """Diffs every commit from a cold DiffCache, with git's patches and with
+    each in-process algorithm."""
+    gd = GitData(repo_path, "main", lazy=True, max_file_size=None)
+    commits = [commit for commit in gd.commits if commit.commit_obj.parents]
+    results: Results = {}
+
+    for algorithm in (None, *ALGORITHMS):
+        def diff_all() -> None:
+            diff_cache = DiffCache(algorithm=algorithm)
+            for commit in commits:
+                diff_cache.get(commit.commit_obj.parents[0], commit.commit_obj,
+                               changes=commit.changed_files)
+            diff_cache.close()
+
+        results[f"DiffCache.get ({algorithm or 'git'})"] = _time(diff_all, repeat)
+    return results
+
+def bench_render(repo_path: str, repeat: int, max_file_size: Optional[int]) -> Results:
+    """Renders every row of the largest file's last commit in a headless
+    FileDiffView, with a cold and then a warm strip cache."""
+    from textual.app import App
+    from rediff.filediffview import FileDiffView
+
+    gd = GitData(repo_path, "main", lazy=True, max_file_size=max_file_size)
+    fh = max(gd.file_histories.values(), key=lambda fh: fh.get_total_length())
+    aligned: AlignedHistory = fh.get_aligned()
+    _check_placeholders(gd)
+    file_commit = list(fh.file_commits.values())[-1]
+    results: Results = {}
+
+    async def run() -> None:
+        app = App()
+        async with app.run_test(size=(60, 50)) as pilot:
+            fv = FileDiffView(file_commit, aligned)
+            await app.mount(fv)
+            await pilot.pause()
+            height = fv.size.height
+            rows = fv.document.line_count
+
+            def render_all(cold: bool) -> None:
+                if cold:
+                    fv._strip_cache.clear()
+                for scroll_y in range(0, rows, height):
+                    fv.scroll_to(y=scroll_y, animate=False)
+                    for y in range(height):
+                        fv.render_line(y)
+
+            for name, cold in (("cold", True), ("warm", False)):
+                timing = _time(lambda: render_all(cold), repeat)
+                timing["rows_per_second"] = rows / timing["min"]
+                results[f"FileDiffView.render_line ({name})"] = timing
+
+    asyncio.run(run())
+    return results
+
+def compare(results: Results, baseline: Results, threshold: float) -> bool:
+    """Prints each timing against the baseline. Returns False if any is
+    more than `threshold` times slower."""
+    ok = True
+    for name, timing in results.items():
+        before = baseline.get(name)
+        if before is None:
+            click.echo(f"{name:40} {timing['min']:10.4f}s   (new)")
+            continue
+        ratio = timing["min"] / before["min"] if before["min"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            ok = False
+        click.echo(f"{name:40} {timing['min']:10.4f}s {before['min']:10.4f}s {ratio:6.2f}x{flag}")
+    return ok
+
+@click.command()
+@click.option('--repo', 'repo_path', type=str, default=None,
+              help='Benchmark an existing repo instead of generating one')
+@click.option('--commits', type=int, default=20, show_default=True)
+@click.option('--files', type=int, default=50, show_default=True)
+@click.option('--lines', type=int, default=500, show_default=True)
+@click.option('--churn', type=float, default=0.1, show_default=True)
+@click.option('--rename', type=float, default=0.01, show_default=True)
+@click.option('--delete', type=float, default=0.005, show_default=True)
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('--repeat', type=int, default=3, show_default=True)
+@click.option('--stream-log', is_flag=True, help='Load with the streaming loader')
+@click.option('-j', '--jobs', type=int, default=1, show_default=True)
+@click.option('--max-file-size', type=ByteSize(), default=0, show_default=True,
+              help='GitData\'s file size limit (0 for no limit); the run fails if any file '
+                   'is over it')
+@click.option('--no-render', is_flag=True, help='Skip the FileDiffView benchmark')
+@click.option('-o', '--output', type=click.Path(), default=None, help='Write results as JSON')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True), default=None,
+              help='Compare against the JSON of an earlier run')
+@click.option('--threshold', type=float, default=1.1, show_default=True,
+              help='Slowdown ratio that counts as a regression')
+def main(repo_path: Optional[str], commits: int, files: int, lines: int, churn: float,
+         rename: float, delete: float, seed: int, repeat: int, stream_log: bool, jobs: int,
+         max_file_size: int, no_render: bool, output: Optional[str], baseline_path: Optional[str],
+         threshold: float) -> None:
+    params: Dict[str, Any] = {"repeat": repeat, "stream_log": stream_log, "jobs": jobs,
+                              "max_file_size": max_file_size}
+    if repo_path is None:
+        repo_path = os.path.join(tempfile.mkdtemp(prefix="rediff-bench-"), "repo")
+        params.update(commits=commits, files=files, lines=lines, churn=churn,
+                      rename=rename, delete=delete, seed=seed)
+        make_repo(repo_path, commits, files, lines, churn, rename, delete, seed)
+    else:
+        params["repo"] = repo_path
+
+    results = bench_gitdata(repo_path, repeat, stream_log, jobs, max_file_size or None)
+    results.update(bench_diff(repo_path, repeat))
+    if not no_render:
+        results.update(bench_render(repo_path, repeat, max_file_size or None))
+
+    report = {
+        "params": params,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if baseline_path:
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+        if baseline.get("params") != params:
+            click.echo("warning: baseline was run with different parameters", err=True)
+        if not compare(results, baseline["results"], threshold):
+            sys.exit(1)
+    else:
+        for name, timing in results.items():
+            click.echo(f"{name:40} {timing['min']:10.4f}s")
+
+if __name__ == "__main__":
+    main()
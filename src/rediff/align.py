@@ -0,0 +1,210 @@
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+# (patch type, line start, line end), with types matching PatchType values
+Patch = Tuple[str, int, int]
+
+ADD = "add"
+DELETE = "delete"
+
+class _Run:
+    """A block of consecutive aligned rows that entered the history together.
+
+    The first commit's whole diff is one run; every later ADD patch starts a
+    new run. A run inserted in front of row `offset` of another run hangs off
+    it as a child, so the final row order is a walk of the run tree.
+    """
+    __slots__ = ("length", "children", "start", "size", "_anchors", "_sizes")
+
+    def __init__(self, length: int):
+        self.length = length
+        self.children: List[Tuple[int, "_Run"]] = []
+        self.start = 0
+        self.size = length
+        self._anchors: List[int] = []
+        self._sizes: List[int] = [0]
+
+    def row(self, offset: int) -> int:
+        """Aligned row of line `offset` of this run, once placed."""
+        return self.start + offset + self._sizes[bisect_right(self._anchors, offset)]
+
+    def ranges(self, line_start: int, line_end: int) -> List[Tuple[int, int]]:
+        """Aligned row ranges covering [line_start, line_end) of this run.
+
+        Rows of runs inserted between these lines are skipped, so one range
+        in run coordinates can come back as several.
+        """
+        lo = bisect_right(self._anchors, line_start)
+        hi = bisect_left(self._anchors, line_end)
+        ranges = []
+        start = line_start
+        for anchor in sorted(set(self._anchors[lo:hi])):
+            ranges.append((self.row(start), self.row(anchor - 1) + 1))
+            start = anchor
+        ranges.append((self.row(start), self.row(line_end - 1) + 1))
+        return ranges
+
+# A slice [start, end) of a run that is visible in some commit
+_Segment = Tuple[_Run, int, int]
+
+class _PostImage:
+    """Cursor over the lines of one commit's resulting file, stored as
+    segments of runs."""
+    def __init__(self, segments: List[_Segment]):
+        self.segments = segments
+        self._index = 0
+        self._offset = 0
+
+    def take(self, count: int, overflow: List[_Run]) -> List[_Segment]:
+        taken: List[_Segment] = []
+        while count > 0 and self._index < len(self.segments):
+            run, start, end = self.segments[self._index]
+            start += self._offset
+            n = min(count, end - start)
+            taken.append((run, start, start + n))
+            count -= n
+            if start + n == end:
+                self._index += 1
+                self._offset = 0
+            else:
+                self._offset += n
+        if count > 0:
+            # The diff references more lines than the previous commit left
+            # behind. Give them their own rows rather than failing.
+            run = _Run(count)
+            overflow.append(run)
+            taken.append((run, 0, count))
+        return taken
+
+    def anchor(self) -> Optional[Tuple[_Run, int]]:
+        """The next unconsumed line, which new lines get inserted in front of."""
+        if self._index >= len(self.segments):
+            return None
+        run, start, _ = self.segments[self._index]
+        return run, start + self._offset
+
+    def rest(self, overflow: List[_Run]) -> List[_Segment]:
+        remaining = sum(end - start for _, start, end in self.segments[self._index:])
+        return self.take(remaining - self._offset, overflow)
+
+def _extend(segments: List[_Segment], new: List[_Segment]) -> None:
+    for run, start, end in new:
+        if start == end:
+            continue
+        if segments and segments[-1][0] is run and segments[-1][2] == start:
+            segments[-1] = (run, segments[-1][1], end)
+        else:
+            segments.append((run, start, end))
+
+def _complement(run: _Run, patches: Sequence[Patch], patch_type: str) -> List[_Segment]:
+    segments: List[_Segment] = []
+    start = 0
+    for p_type, line_start, line_end in patches:
+        if p_type == patch_type:
+            _extend(segments, [(run, start, line_start)])
+            start = line_end
+    _extend(segments, [(run, start, run.length)])
+    return segments
+
+def _place(roots: List[_Run]) -> int:
+    """Assigns aligned start rows to every run. Returns the total row count."""
+    # Post-order pass for subtree sizes
+    order: List[_Run] = []
+    stack = list(roots)
+    while stack:
+        run = stack.pop()
+        order.append(run)
+        run.children.sort(key=lambda child: child[0])  # stable: keeps commit order
+        stack.extend(child for _, child in run.children)
+    for run in reversed(order):
+        run.size = run.length + sum(child.size for _, child in run.children)
+        run._anchors = [offset for offset, _ in run.children]
+        run._sizes = [0]
+        for _, child in run.children:
+            run._sizes.append(run._sizes[-1] + child.size)
+
+    # Pre-order pass for start rows
+    start = 0
+    for root in roots:
+        root.start = start
+        start += root.size
+    stack = list(roots)
+    while stack:
+        run = stack.pop()
+        cursor = run.start
+        prev_offset = 0
+        for offset, child in run.children:
+            cursor += offset - prev_offset
+            child.start = cursor
+            cursor += child.size
+            prev_offset = offset
+        stack.extend(child for _, child in run.children)
+    return start
+
+def align(diffs: Sequence[Tuple[int, Sequence[Patch]]]) -> Tuple[List[List[Patch]], int]:
+    """Aligns the full-file diffs of consecutive commits to the same file.
+
+    Args:
+        diffs: (diff line count, patches) for each commit, oldest first.
+            Patch coordinates are lines of that commit's diff text.
+
+    Returns:
+        Every commit's patches in aligned row coordinates, in which each line
+        that ever existed in the history has exactly one row, and the total
+        number of rows.
+
+    Each commit's view of the file is kept as a list of run segments. The
+    next commit's diff is replayed against it patch by patch, so the work is
+    proportional to patches and segments, not to file lines. Rows are only
+    numbered at the end, once all insertions are known.
+    """
+    if not diffs:
+        return [], 0
+
+    first_length, first_patches = diffs[0]
+    root = _Run(first_length)
+    roots = [root]
+    tail: List[_Run] = []
+    pieces: List[List[Tuple[str, _Run, int, int]]] = [
+        [(p_type, root, start, end) for p_type, start, end in first_patches]
+    ]
+    post_image = _PostImage(_complement(root, sorted(first_patches, key=_by_start), DELETE))
+
+    for _, patches in diffs[1:]:
+        commit_pieces: List[Tuple[str, _Run, int, int]] = []
+        segments: List[_Segment] = []
+        line_no = 0
+        for p_type, start, end in sorted(patches, key=_by_start):
+            _extend(segments, post_image.take(start - line_no, tail))
+            if p_type == DELETE:
+                for run, seg_start, seg_end in post_image.take(end - start, tail):
+                    commit_pieces.append((DELETE, run, seg_start, seg_end))
+            else:
+                run = _Run(end - start)
+                anchor = post_image.anchor()
+                if anchor is None:
+                    tail.append(run)
+                else:
+                    anchor_run, offset = anchor
+                    anchor_run.children.append((offset, run))
+                commit_pieces.append((ADD, run, 0, end - start))
+                _extend(segments, [(run, 0, end - start)])
+            line_no = end
+        _extend(segments, post_image.rest(tail))
+        pieces.append(commit_pieces)
+        post_image = _PostImage(segments)
+
+    total_length = _place(roots + tail)
+
+    all_patches = []
+    for commit_pieces in pieces:
+        patches_: List[Patch] = []
+        for p_type, run, start, end in commit_pieces:
+            for row_start, row_end in run.ranges(start, end):
+                patches_.append((p_type, row_start, row_end))
+        patches_.sort(key=_by_start)
+        all_patches.append(patches_)
+    return all_patches, total_length
+
+def _by_start(patch: Patch) -> int:
+    return patch[1]
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import zlib
+from array import array
+from typing import List, Optional, Sequence, Set, Tuple
+
+CACHE_DIR = "rediff"
+CACHE_FILE = "cache.sqlite3"
+
+# Patches are stored as flat (type, start, end) int triples
+PATCH_TYPES = ("add", "delete")
+
+class DiskCache:
+    """Parsed FileCommit data stored under .git/rediff/.
+
+    Rows are keyed by (merge-base sha, commit sha, path). A commit sha pins
+    its tree and its parent, so a row never goes stale: after a rebase the
+    surviving commits still hit and only rewritten ones are recomputed.
+    """
+    def __init__(self, git_dir: str, merge_base: str):
+        self.merge_base = merge_base
+        cache_dir = os.path.join(git_dir, CACHE_DIR)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Callers serialize access, but it may come from a prefetch thread
+        self._db = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE),
+                                   check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_commits ("
+            " merge_base TEXT NOT NULL,"
+            " sha TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " diff_text BLOB NOT NULL,"
+            " patches BLOB NOT NULL,"
+            " PRIMARY KEY (merge_base, sha, path))")
+        self._pending: List[Tuple[str, str, str, bytes, bytes]] = []
+
+    def get(self, sha: str, path: str) -> Optional[Tuple[List[str], List[Tuple[str, int, int]]]]:
+        row = self._db.execute(
+            "SELECT diff_text, patches FROM file_commits"
+            " WHERE merge_base = ? AND sha = ? AND path = ?",
+            (self.merge_base, sha, path)).fetchone()
+        if row is None:
+            return None
+        diff_blob, patches_blob = row
+        diff_text = zlib.decompress(diff_blob).decode('utf-8').split('\n')
+        if diff_text == ['']:
+            diff_text = []
+
+        packed = array('i')
+        packed.frombytes(patches_blob)
+        patches = [(PATCH_TYPES[packed[i]], packed[i+1], packed[i+2])
+                   for i in range(0, len(packed), 3)]
+        return diff_text, patches
+
+    def cached_paths(self, sha: str) -> Set[str]:
+        """Paths of the commit's files that have a row."""
+        rows = self._db.execute(
+            "SELECT path FROM file_commits WHERE merge_base = ? AND sha = ?",
+            (self.merge_base, sha))
+        return {path for path, in rows}
+
+    def put(self, sha: str, path: str, diff_text: Sequence[str],
+            patches: List[Tuple[str, int, int]]) -> None:
+        packed = array('i')
+        for patch_type, line_start, line_end in patches:
+            packed.extend((PATCH_TYPES.index(patch_type), line_start, line_end))
+        self._pending.append((
+            self.merge_base,
+            sha,
+            path,
+            zlib.compress('\n'.join(diff_text).encode('utf-8')),
+            packed.tobytes(),
+        ))
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO file_commits VALUES (?, ?, ?, ?, ?)",
+                self._pending)
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
@@ -1,112 +1,115 @@
 import click
-from collections import OrderedDict
-
-from textual.app import App, ComposeResult
-from textual.containers import HorizontalScroll, Vertical
-from textual.widgets import Label
-
-from rediff.db import GitData, FileHistory, FileCommit
-from rediff.filediffview import FileDiffView, Cmd
-
-class SingleFileAllCommits(HorizontalScroll):
-    def __init__(self, file_history: FileHistory) -> None:
-        super().__init__()
-        self.file_history = file_history
-        self.file_views: OrderedDict[str, CommitFilePane] = OrderedDict()
-        self._curr_pane = 0
-
-    def compose(self) -> ComposeResult:
-        for file_commit in self.file_history.file_commits.values():
-            self.file_views[file_commit.sha] = CommitFilePane(
-                file_commit,
-                self.file_history,
-            )
-
-        yield HorizontalScroll(*self.file_views.values())
-
-    def on_mount(self) -> None:
-        self.focus_pane(self._curr_pane)
-
-    def focus_pane(self, next_pane: int):
-        num_panes = len(self.file_views.keys())
-        next_pane = min(max(0, next_pane), num_panes-1)
-        for i, commit_file_pane in enumerate(self.file_views.values()):
-            if i == next_pane:
-                commit_file_pane.fv.show_cursor = True
-                commit_file_pane.fv.focus()
-            else:
-                commit_file_pane.fv.show_cursor = False
-        self._curr_pane = next_pane
-
-    def on_file_diff_view_parent_command(self, command: FileDiffView.ParentCommand) -> None:
-        if command.cmd == Cmd.FOCUS_PANE_LEFT:
-            self.focus_pane(self._curr_pane - 1)
-        elif command.cmd == Cmd.FOCUS_PANE_RIGHT:
-            self.focus_pane(self._curr_pane + 1)
-        elif command.cmd == Cmd.CURSOR_MOVE:
-            for cp in self.file_views.values():
-                if command.data:
-                    cp.fv.move_cursor(command.data["location"])
-
-class CommitFilePane(Vertical):
-    def __init__(self, file_commit: FileCommit, file_history: FileHistory) -> None:
-        super().__init__()
-        self.file_commit = file_commit
-        self.file_history = file_history
-
-    def compose(self) -> ComposeResult:
-        yield Label(f"{self.file_commit.commit.short}\n"
-                    f"{self.file_commit.commit.summary}")
-        yield Label(f"{self.file_commit.file_name}")
-        self.fv = FileDiffView(
-                self.file_commit,
-                self.file_history.get_all_patches(),
-                self.file_history.get_total_length(),
-            )
-        yield self.fv
-
-class Rediff(App):
-    CSS_PATH = "app.tcss"
-
-    def __init__(self, repo_path: str, base_ref: str) -> None:
-        super().__init__()
-        self.gitdata: GitData = GitData(repo_path, base_ref)  # Assuming GitData is a class
-        self._curr_file: int = 0
-        self.file_view: SingleFileAllCommits
-
-    def compose(self) -> ComposeResult:
-        file_history = self.gitdata.get_file_history(self._curr_file)
-        self.file_view = SingleFileAllCommits(file_history)
-        yield self.file_view
-
-    def show_file(self, file_num_: int) -> None:
-        num_files = len(self.gitdata.file_histories)
-        file_num = min(num_files-1, max(0, file_num_))
-        if file_num != file_num_:
-            return
-        self.file_view.remove()
-
-        file_history = self.gitdata.get_file_history(self._curr_file)
-        self.file_view = SingleFileAllCommits(file_history)
-        self.file_view.mount()
-        self._curr_file = file_num
-        self.mount(self.file_view)
-
-    def on_file_diff_view_parent_command(self, command: FileDiffView.ParentCommand) -> None:
-        print("here 2")
-        if command.cmd == "focus_file_prev":
-            print("prev file")
-            self.show_file(self._curr_file - 1)
-        if command.cmd == "focus_file_next":
-            print("next file")
-            self.show_file(self._curr_file + 1)
-
-@click.command()
-@click.argument('base_ref', type=str)
-@click.option('-C', '--repo_path', type=str, default='.', help='The repository path (optional)')
-def app(base_ref: str, repo_path: str) -> None:
-    app: Rediff = Rediff(repo_path, base_ref)
+import os
+
+from typing import Any, Callable, List, Optional
+
+from rediff.db import DEFAULT_MAX_FILE_SIZE, GitData
+from rediff.linediff import ALGORITHMS
+from rediff.profiler import Profiler
+
+class DefaultGroup(click.Group):
+    """Runs the `view` command when the first argument isn't a subcommand,
+    so `rediff BASE_REF` keeps working."""
+    def parse_args(self, ctx: click.Context, args: List[str]) -> List[str]:
+        if args and args[0] not in self.commands and args[0] not in ("--help", "-h"):
+            args = ["view", *args]
+        return super().parse_args(ctx, args)
+
+class ByteSize(click.ParamType):
+    """A size in bytes, with an optional K, M or G suffix."""
+    name = "size"
+    UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+    def convert(self, value: Any, param: Optional[click.Parameter],
+                ctx: Optional[click.Context]) -> int:
+        if isinstance(value, int):
+            return value
+        text = str(value).strip().upper().removesuffix("B")
+        unit = text[-1:] if text[-1:] in self.UNITS else ""
+        try:
+            return int(float(text[:len(text) - len(unit)]) * self.UNITS[unit])
+        except ValueError:
+            self.fail(f"{value!r} is not a size like 500M", param, ctx)
+
+def load_options(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Options shared by every command that loads GitData."""
+    options = [
+        click.argument('base_ref', type=str),
+        click.option('-C', '--repo_path', type=str, default='.', help='The repository path (optional)'),
+        click.option('--cache/--no-cache', default=True, help='Reuse parsed diffs stored in .git/rediff/'),
+        click.option('--stream-log', is_flag=True, help='Load every diff from a single `git log -p` process'),
+        click.option('-j', '--jobs', type=int, default=os.cpu_count() or 1, show_default=True,
+                     help='Processes to extract diffs with'),
+        click.option('--max-file-size', type=ByteSize(), default=DEFAULT_MAX_FILE_SIZE,
+                     show_default=True,
+                     help='Show files bigger than this size as a placeholder, e.g. 5M (0 for no limit)'),
+        click.option('--diff-algorithm', type=click.Choice(['git', *ALGORITHMS]), default='git',
+                     show_default=True,
+                     help='Diff file contents in process with this algorithm instead of asking git'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+def _algorithm(diff_algorithm: str) -> Optional[str]:
+    """GitData's diff_algorithm for a --diff-algorithm choice."""
+    return None if diff_algorithm == 'git' else diff_algorithm
+
+@click.group(cls=DefaultGroup)
+def app() -> None:
+    """Shows how each file changes across the commits of a branch."""
+
+@app.command()
+@load_options
+@click.option('--profile', 'profile_path', type=click.Path(dir_okay=False), default=None,
+              help='Time loading and rendering, write a Chrome trace here and print a summary')
+@click.option('--syntax/--no-syntax', default=False, show_default=True,
+              help='Syntax highlight lines, lexed as they come into view')
+@click.option('--max-memory', type=ByteSize(), default=None,
+              help='Unload the least recently viewed files past this size, e.g. 500M. '
+                   'Interned line text is not counted.')
+def view(base_ref: str, repo_path: str, cache: bool, stream_log: bool, jobs: int,
+         max_file_size: int, diff_algorithm: str, profile_path: Optional[str], syntax: bool,
+         max_memory: Optional[int]) -> None:
+    """Browse the branch in the terminal (the default command)."""
+    from rediff.tui import Rediff
+
+    profiler = Profiler() if profile_path else None
+    app: Rediff = Rediff(repo_path, base_ref, cache, stream_log, jobs, max_file_size or None,
+                         profiler, syntax, max_memory, _algorithm(diff_algorithm))
     app.run()
+    # The app's worker threads have finished by now
+    if app.gitdata is not None:
+        app.gitdata.close()
+    if profiler and profile_path:
+        profiler.write_trace(profile_path)
+        click.echo(profiler.table())
+        click.echo(f"\nTrace written to {profile_path}")
+
+@app.command()
+@load_options
+@click.option('--format', 'format_', type=click.Choice(['jsonl', 'html']), default='jsonl',
+              show_default=True)
+@click.option('-o', '--output', type=click.File('w'), default='-', help='Output file (default stdout)')
+def export(base_ref: str, repo_path: str, cache: bool, stream_log: bool, jobs: int,
+           max_file_size: int, diff_algorithm: str, format_: str, output: Any) -> None:
+    """Write every file's aligned history without starting the TUI.
+
+    Files are loaded and written one at a time, so output starts right
+    away and memory stays flat on large branches.
+    """
+    from rediff.export import iter_html, iter_jsonl
+
+    gitdata = GitData(repo_path, base_ref, cache, lazy=True, streaming=stream_log, jobs=jobs,
+                      max_file_size=max_file_size or None,
+                      diff_algorithm=_algorithm(diff_algorithm))
+    chunks = iter_jsonl(gitdata) if format_ == 'jsonl' else iter_html(gitdata)
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
+    finally:
+        gitdata.close()
 
 if __name__ == "__main__":
     app()
@@ -1,10 +1,45 @@
+import multiprocessing.util
+import threading
 from collections import OrderedDict
-from typing import List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
 from enum import Enum
 
-from git import Repo, NULL_TREE
+from git import Blob, Repo, NULL_TREE
 from git.objects.commit import Commit
 from git.diff import Diff
+from git.util import hex_to_bin
+
+from rediff.align import Patch, align
+from rediff.cache import DiskCache
+from rediff.fileindex import FileIndex, FileStats
+from rediff.linediff import diff_blobs
+from rediff.lines import LinePool, PooledLines, pad, post_image, split_diff_line
+from rediff.loader import BlobReader, FileChange, iter_log
+from rediff.profiler import AnyProfiler, NullProfiler, Profiler
+from rediff.search import SearchIndex
+from rediff.worddiff import PairCache, WordDiff
+
+# Called with (stage, done, total) as GitData loads. Stages are "commits" and
+# "files"; total is 0 while it isn't known yet.
+ProgressCallback = Callable[[str, int, int], None]
+
+# {path: (parent path, diff lines)} for one commit. Lines are None for a
+# binary file.
+FileDiffs = Dict[str, Tuple[str, Optional[List[str]]]]
+
+# Blob sha git uses for the missing side of an added or deleted file
+NULL_SHA = "0" * 40
+
+# A file is binary if its start has a NUL byte, as git decides
+BINARY_CHECK_SIZE = 8000
+
+# Files bigger than this, in bytes, are shown as a placeholder
+DEFAULT_MAX_FILE_SIZE = 2 * 1024 * 1024
+# Padded content of recently viewed files kept aligned, in bytes
+DEFAULT_MAX_ALIGNED_SIZE = 64 * 1024 * 1024
+
+BINARY_FILE = "Binary file"
 
 class PatchType(str, Enum):
     ADD = "add"
@@ -22,7 +57,7 @@ class CommitWrapper:
         self.short = _utf_decode(commit_obj.hexsha[:8])
         self.summary = _utf_decode(commit_obj.summary)
         self.message = commit_obj.message
-        self.changed_files: List[Diff] = []
+        self.changed_files: List[Union[Diff, FileChange]] = []
         self.commit_obj = commit_obj
 
     def __str__(self) -> str:
@@ -30,96 +65,379 @@ class CommitWrapper:
                 f"summary: {self.summary}\n"
                 f"num files: {len(self.changed_files)}")
 
+class DiffCache:
+    """Full-context patch text for each commit, computed once per
+    (parent sha, commit sha) and split up by path.
+
+    Every FileCommit of a commit reads from the same entry, so a commit's tree
+    diff runs once no matter how many files the branch touches. Diff lines are
+    interned into `pool` as they come in.
+
+    With an `algorithm` from rediff.linediff, git only lists the changed
+    files; their blobs are read over one `git cat-file --batch` process and
+    diffed here, as line ids, instead of git sending patch text.
+
+    With `per_path`, get() diffs just the file asked for, so loading one file
+    doesn't diff and intern every other file its commits touch.
+    """
+    def __init__(self, disk_cache: Optional[DiskCache] = None,
+                 pool: Optional[LinePool] = None,
+                 profiler: Optional[AnyProfiler] = None,
+                 algorithm: Optional[str] = None, per_path: bool = False) -> None:
+        self.pool = pool or LinePool()
+        self.profiler = profiler or NullProfiler()
+        self.algorithm = algorithm
+        self.per_path = per_path
+        self._blob_reader: Optional[BlobReader] = None
+        self._diffs: Dict[Tuple[str, str], Dict[str, Tuple[str, Optional[PooledLines]]]] = {}
+        # Patches parsed alongside the diff text by prefill()
+        self._patches: Dict[Tuple[str, str], Dict[str, List[Patch]]] = {}
+        # File contents as context lines, by blob sha
+        self._blobs: Dict[str, PooledLines] = {}
+        # Paths dropped from a commit's diffs by forget()
+        self._forgotten: Dict[Tuple[str, str], Set[str]] = {}
+        # Size of the diff and blob lines held, see LinePool.nbytes for the text
+        self.nbytes = 0
+        # Paths left out of every tree diff, see exclude()
+        self.excluded_paths: Set[str] = set()
+        self.disk_cache = disk_cache
+        # GitPython's persistent git processes aren't thread safe, so all git
+        # and disk cache access for FileCommits goes through this lock.
+        self.lock = threading.RLock()
+
+    def get(self, parent_commit: Commit, commit: Commit, path: Optional[str] = None,
+            changes: Optional[Sequence[Union[Diff, FileChange]]] = None,
+            ) -> Dict[str, Tuple[str, Optional[PooledLines]]]:
+        """Returns {path: (parent path, diff lines)} for every file changed
+        between parent_commit and commit.
+
+        If `path` was dropped by forget(), the commit is diffed again to put
+        it back. `changes`, the commit's changed files if already listed,
+        saves asking git for them again.
+
+        In per_path mode only `path` is diffed, if it isn't yet, and the
+        entry fills in a path at a time.
+        """
+        key = (parent_commit.hexsha, commit.hexsha)
+        file_diffs = self._diffs.get(key)
+        forgotten = self._forgotten.get(key, set())
+        if self.per_path and path is not None and (file_diffs is None or path not in file_diffs):
+            new_diffs = self._diff_path(parent_commit, commit, path, changes)
+            file_diffs = self._diffs.setdefault(key, {})
+            forgotten.discard(path)
+            for new_path, diff in new_diffs.items():
+                if new_path not in file_diffs:
+                    file_diffs[new_path] = diff
+                    self.nbytes += _diffs_nbytes({new_path: diff})
+        elif file_diffs is None or path in forgotten:
+            with self.profiler.span("tree diff", commit=commit.hexsha[:8]):
+                if self.algorithm:
+                    if changes is None:
+                        changes = parent_commit.diff(commit)
+                    new_diffs = _diff_blobs(self.pool, self._reader(commit.repo), changes,
+                                            self.excluded_paths, self.algorithm)
+                else:
+                    new_diffs = self._encode(
+                        _diff_commit(parent_commit, commit, self.excluded_paths))
+            if file_diffs is None:
+                file_diffs = self._diffs[key] = new_diffs
+                self.nbytes += _diffs_nbytes(new_diffs)
+            else:
+                assert path is not None
+                forgotten.discard(path)
+                if path in new_diffs:
+                    file_diffs[path] = new_diffs[path]
+                    self.nbytes += _diffs_nbytes({path: new_diffs[path]})
+        return file_diffs
+
+    def _diff_path(self, parent_commit: Commit, commit: Commit, path: str,
+                   changes: Optional[Sequence[Union[Diff, FileChange]]],
+                   ) -> Dict[str, Tuple[str, Optional[PooledLines]]]:
+        if changes is None:
+            changes = parent_commit.diff(commit)
+        # A renamed file's diff needs its old path in the pathspec too
+        changes = [change for change in changes if (change.b_path or change.a_path) == path]
+        with self.profiler.span("file diff", file=path, commit=commit.hexsha[:8]):
+            if self.algorithm:
+                return _diff_blobs(self.pool, self._reader(commit.repo), changes,
+                                   self.excluded_paths, self.algorithm)
+            paths = {path} | {change.a_path for change in changes if change.a_path}
+            return self._encode(_diff_commit(parent_commit, commit, self.excluded_paths, paths))
+
+    def exclude(self, paths: Iterable[Optional[str]]) -> None:
+        """Leaves paths out of the tree diffs run from now on, so git never
+        sends their text."""
+        self.excluded_paths.update(path for path in paths if path)
+
+    def get_patches(self, parent_sha: str, sha: str, file_name: str) -> Optional[List[Patch]]:
+        return self._patches.get((parent_sha, sha), {}).get(file_name)
+
+    def put(self, parent_sha: str, sha: str, file_diffs: FileDiffs) -> None:
+        self._put((parent_sha, sha), self._encode(file_diffs))
+
+    def _put(self, key: Tuple[str, str],
+             file_diffs: Dict[str, Tuple[str, Optional[PooledLines]]]) -> None:
+        old_diffs = self._diffs.get(key)
+        if old_diffs is not None:
+            self.nbytes -= _diffs_nbytes(old_diffs)
+        self._diffs[key] = file_diffs
+        self._forgotten.pop(key, None)
+        self.nbytes += _diffs_nbytes(file_diffs)
+
+    def retain(self, shas: Set[str]) -> None:
+        """Drops the diffs of commits not in `shas`, e.g. after a rebase."""
+        with self.lock:
+            for key in [key for key in self._diffs if key[1] not in shas]:
+                self.nbytes -= _diffs_nbytes(self._diffs.pop(key))
+                self._forgotten.pop(key, None)
+            for key in [key for key in self._patches if key[1] not in shas]:
+                del self._patches[key]
+
+    def forget(self, file_commits: Iterable["FileCommit"]) -> None:
+        """Drops the diff lines and blobs of file_commits, which get()
+        and git fetch again when they're next loaded."""
+        with self.lock:
+            for fc in file_commits:
+                if fc.commit.commit_obj.parents:
+                    key = (fc.commit.commit_obj.parents[0].hexsha, fc.sha)
+                    file_diffs = self._diffs.get(key)
+                    if file_diffs is not None and fc.file_name in file_diffs:
+                        self.nbytes -= _diffs_nbytes({fc.file_name: file_diffs.pop(fc.file_name)})
+                        self._forgotten.setdefault(key, set()).add(fc.file_name)
+                if fc.blob_sha is not None:
+                    blob = self._blobs.pop(fc.blob_sha, None)
+                    if blob is not None:
+                        self.nbytes -= blob.nbytes
+
+    def get_blob(self, blob_sha: str) -> Optional[PooledLines]:
+        return self._blobs.get(blob_sha)
+
+    def put_blob(self, blob_sha: str, lines: PooledLines) -> None:
+        if blob_sha not in self._blobs:
+            self._blobs[blob_sha] = lines
+            self.nbytes += lines.nbytes
+
+    def _reader(self, repo: Repo) -> BlobReader:
+        if self._blob_reader is None:
+            self._blob_reader = BlobReader(str(repo.git_dir))
+        return self._blob_reader
+
+    def close(self) -> None:
+        """Stops the `git cat-file` process, if one was started."""
+        if self._blob_reader is not None:
+            self._blob_reader.close()
+            self._blob_reader = None
+
+    def _encode(self, file_diffs: FileDiffs) -> Dict[str, Tuple[str, Optional[PooledLines]]]:
+        return {path: (parent_path, None if lines is None else self.pool.encode(lines))
+                for path, (parent_path, lines) in file_diffs.items()}
+
+    def _disk_cached(self, commit: "CommitWrapper") -> bool:
+        """Whether the disk cache has every file of commit a tree diff
+        would give, so diffing it again would be wasted."""
+        if not self.disk_cache:
+            return False
+        paths = {change.b_path or change.a_path for change in commit.changed_files}
+        return paths - self.excluded_paths <= self.disk_cache.cached_paths(commit.hexsha)
+
+    def prefill(self, repo_path: str, commits: List["CommitWrapper"], jobs: int) -> None:
+        """Extracts and parses the diffs of every commit over a pool of `jobs`
+        processes, merging the results back in commit order."""
+        with self.lock:
+            todo = [(c.commit_obj.parents[0].hexsha, c.hexsha) for c in commits
+                    if c.commit_obj.parents
+                    and (c.commit_obj.parents[0].hexsha, c.hexsha) not in self._diffs
+                    and not self._disk_cached(c)]
+        if not todo:
+            return
+
+        with self.profiler.span("prefill diffs", commits=len(todo)), ProcessPoolExecutor(
+            max_workers=min(jobs, len(todo)),
+            initializer=_init_diff_worker,
+            initargs=(repo_path, self.excluded_paths, self.algorithm),
+        ) as executor:
+            parent_shas, shas = zip(*todo)
+            results = executor.map(_diff_commit_worker, parent_shas, shas)
+            for key, (file_diffs, patches) in zip(todo, results):
+                with self.lock:
+                    if key not in self._diffs:
+                        self._put(key, self._encode(file_diffs))
+                    self._patches.setdefault(key, patches)
+
 class FileCommit:
-    def __init__(self, file_name: str, commit: CommitWrapper):
+    """One commit's view of one file.
+
+    diff_text is kept as ids into the DiffCache's LinePool, so text shared
+    between commits is only stored once.
+
+    A commit that doesn't change the file (changed=False) has no diff of its
+    own: its content is the file at `blob_sha`, shared with every other such
+    commit and taken from the `previous` commit's result where possible.
+    """
+    def __init__(self, file_name: str, commit: CommitWrapper,
+                 diff_cache: Optional[DiffCache] = None, blob_sha: Optional[str] = None,
+                 changed: bool = True, previous: Optional["FileCommit"] = None):
         self.sha = commit.hexsha
         self.file_name = file_name
         self.commit = commit
-        self.diff_text = self._get_diff_text()
+        self.diff_cache = diff_cache or DiffCache()
+        # The file's blob after this commit, NULL_SHA if it doesn't exist and
+        # None if unknown
+        self.blob_sha = blob_sha
+        self.changed = changed
+        self.previous = previous
+        # Set when the file is too big or binary: the content is left empty
+        # and this says why
+        self.placeholder: Optional[str] = None
+        self._diff_text: Optional[PooledLines] = None
+        self._patches: List[Tuple[str, int, int]] = []
 
-    def get_content(self, all_patches, total_length):
-        skips = {}
-        seen_our_commit = False
+    @property
+    def diff_text(self) -> PooledLines:
+        if self._diff_text is None:
+            self.load()
+        assert self._diff_text is not None
+        return self._diff_text
 
-        for commit, patches in all_patches.items():
-            if commit == self.sha:
-                seen_our_commit = True
-            elif not seen_our_commit:
-                for patch in patches:
-                    if patch['type'] == PatchType.DELETE:
-                        skips[patch['line_start']] = (
-                            patch['line_end'] - patch['line_start'])
-                    else:
-                        for patch in patches:
-                            if patch['type'] == PatchType.ADD:
-                                skips[patch['line_start']] = (
-                                    patch['line_end'] - patch['line_start'])
+    @property
+    def loaded(self) -> bool:
+        return self._diff_text is not None
 
-        text = []
-        diff_pointer = 0
-        while len(text) < total_length:
+    def load(self) -> None:
+        """Fetches diff text and patches from the disk cache or git."""
+        with self.diff_cache.lock:
+            if self._diff_text is not None:
+                return
+            with self.diff_cache.profiler.span(
+                    "load", file=self.file_name, commit=self.commit.short):
+                self._load()
 
-            skip_len = skips.get(len(text))
-            if skip_len is not None:
-                for j in range(skip_len):
-                    text.append('x')
-                    continue
+    def _load(self) -> None:
+        if self.placeholder:
+            self._patches = []
+            self._diff_text = PooledLines.empty(self.diff_cache.pool)
+            return
 
-            text.append(self.diff_text[diff_pointer])
-            diff_pointer += 1
+        if not self.changed:
+            self._patches = []
+            self._diff_text = self._get_unchanged_text()
+            return
 
-        return '\n'.join(text)
+        disk_cache = self.diff_cache.disk_cache
+        cached = disk_cache.get(self.sha, self.file_name) if disk_cache else None
+        if cached:
+            cached_text, self._patches = cached
+            diff_text = self.diff_cache.pool.encode(cached_text)
+        else:
+            diff_lines = self._get_diff_text()
+            if diff_lines is None:
+                self.placeholder = BINARY_FILE
+                self._patches = []
+                self._diff_text = PooledLines.empty(self.diff_cache.pool)
+                return
+            diff_text = diff_lines
+            parent_sha = self.commit.commit_obj.parents[0].hexsha
+            patches = self.diff_cache.get_patches(parent_sha, self.sha, self.file_name)
+            if patches is None:
+                patches = [(p.type.value, p.line_start, p.line_end)
+                           for p in _parse_patches(diff_text)]
+            self._patches = patches
+            if disk_cache:
+                disk_cache.put(self.sha, self.file_name, diff_text, self._patches)
+        if self.blob_sha is not None:
+            self.diff_cache.put_blob(self.blob_sha, post_image(diff_text))
+        self._diff_text = diff_text
 
-    def _get_diff_text(self) -> List[str]:
+    def unload(self) -> None:
+        """Drops the loaded diff text. load() fetches it again."""
+        with self.diff_cache.lock:
+            self._diff_text = None
+            self._patches = []
+
+    def get_content(self, all_patches: OrderedDict[str, List[PatchInfo]], total_length: int) -> str:
+        return self.get_lines(all_patches, total_length).text
+
+    def get_lines(self, all_patches: OrderedDict[str, List[PatchInfo]],
+                  total_length: int) -> PooledLines:
+        """Pads diff_text out to the aligned rows of all_patches.
+
+        Rows deleted by an earlier commit or added by a later one don't exist
+        in this commit, and are filled with 'x' placeholder lines.
+        """
+        hidden = []
+        seen_our_commit = False
+        for commit, patches in all_patches.items():
+            if commit == self.sha:
+                seen_our_commit = True
+                continue
+            hidden_type = PatchType.ADD if seen_our_commit else PatchType.DELETE
+            for patch in patches:
+                if patch.type == hidden_type:
+                    hidden.append((patch.line_start, patch.line_end))
+        hidden.sort()
+
+        return pad(self.diff_text, hidden, total_length)
+
+    def _get_diff_text(self) -> Optional[PooledLines]:
+        """The file's diff lines in this commit, or None if it's binary."""
         parent_commit = self.commit.commit_obj.parents[0]
 
-        all_diff_wrappers = parent_commit.diff(self.commit.commit_obj, create_patch=True, unified=999999)
+        file_diffs = self.diff_cache.get(parent_commit, self.commit.commit_obj, self.file_name,
+                                         self.commit.changed_files)
 
         parent_file_name = self.file_name
-        diff_bytes = None
-        for diff_w in all_diff_wrappers:
-            if diff_w.rename_to == self.file_name: # renamed
-                diff_bytes = diff_w.diff
-                parent_file_name = diff_w.rename_from
-            elif diff_w.b_path == self.file_name:
-                diff_bytes = diff_w.diff
-
-        text = []
-        if diff_bytes:
-            text = diff_bytes.decode('utf-8').splitlines()[1:]
+        file_diff = file_diffs.get(self.file_name)
+        if file_diff:
+            parent_file_name, diff_lines = file_diff
+            if diff_lines is None or diff_lines:
+                return diff_lines
+
+        # No diff lines, e.g. a rename, a mode change or an empty added file:
+        # the content is the parent side's
+        parent_blob_sha = self._parent_blob_sha()
+        if parent_blob_sha == NULL_SHA:
+            return PooledLines.empty(self.diff_cache.pool)
+        if parent_blob_sha is not None:
+            parent_blob = Blob(parent_commit.repo, hex_to_bin(parent_blob_sha))
         else:
             parent_blob = parent_commit.tree / parent_file_name
-            for line in parent_blob.data_stream.read().decode('utf-8').splitlines():
-                text.append(f' {line}')
+        return self.diff_cache.pool.encode(
+            f' {line}' for line in _decode_lines(parent_blob.data_stream.read()))
 
-        return text
+    def _parent_blob_sha(self) -> Optional[str]:
+        """The file's blob sha before this commit, None if unknown."""
+        for change in self.commit.changed_files:
+            if (change.b_path or change.a_path) == self.file_name:
+                return _blob_shas(change)[0]
+        return None
 
-    def get_patches(self) -> List[PatchInfo]:
-        patches: List[PatchInfo] = []
-        patch_add = patch_del = None
+    def _get_unchanged_text(self) -> PooledLines:
+        if self.blob_sha is not None:
+            lines = self.diff_cache.get_blob(self.blob_sha)
+            if lines is not None:
+                return lines
 
-        def finish_patch(patch_type, patch_start, line_no):
-            if patch_start is not None:
-                patches.append(PatchInfo(patch_type, patch_start, line_no))
-            return None
-
-        for line_no, line in enumerate(self.diff_text):
-            if line.startswith('+'):
-                patch_del = finish_patch(PatchType.DELETE, patch_del, line_no)
-                if patch_add is None:
-                    patch_add = line_no
-            elif line.startswith('-'):
-                patch_add = finish_patch(PatchType.ADD, patch_add, line_no)
-                if patch_del is None:
-                    patch_del = line_no
-            else:
-                patch_add = finish_patch(PatchType.ADD, patch_add, line_no)
-                patch_del = finish_patch(PatchType.DELETE, patch_del, line_no)
+        if self.previous is not None:
+            lines = post_image(self.previous.diff_text)
+        elif self.blob_sha == NULL_SHA:
+            lines = PooledLines.empty(self.diff_cache.pool)
+        elif self.blob_sha is not None:
+            commit_obj = self.commit.commit_obj
+            blob = Blob(commit_obj.repo, hex_to_bin(self.blob_sha))
+            lines = self.diff_cache.pool.encode(
+                f' {line}' for line in _decode_lines(blob.data_stream.read()))
+        else:
+            lines = post_image(self._get_diff_text() or PooledLines.empty(self.diff_cache.pool))
 
-        finish_patch(PatchType.ADD, patch_add, line_no+1)
-        finish_patch(PatchType.DELETE, patch_del, line_no+1)
+        if self.blob_sha is not None:
+            self.diff_cache.put_blob(self.blob_sha, lines)
+        return lines
 
-        return patches
+    def get_patches(self) -> List[PatchInfo]:
+        if self._diff_text is None:
+            self.load()
+        return [PatchInfo(PatchType(patch_type), line_start, line_end)
+                for patch_type, line_start, line_end in self._patches]
 
     def __str__(self) -> str:
         return f"FileCommit: {self.file_name} @sha: {self.sha}"
@@ -128,12 +446,25 @@ class FileCommit:
         return str(self)
 
 class FileHistory:
-    def __init__(self) -> None:
+    def __init__(self, diff_cache: Optional[DiffCache] = None,
+                 blob_sha: Optional[str] = None) -> None:
         self._orig_file_name: Optional[str] = None
         self._current_file_name: Optional[str] = None
+        # The file's blob as of the last filled commit
+        self._blob_sha = blob_sha
+        # Why the file is shown as a placeholder instead of its history
+        self.placeholder: Optional[str] = None
         self.file_commits: OrderedDict[str, FileCommit] = OrderedDict()
+        self.diff_cache = diff_cache or DiffCache()
+        self._aligned: Optional[AlignedHistory] = None
+        # Called whenever the history is aligned anew, e.g. for GitData to
+        # count a file that's loaded again after being evicted
+        self.on_aligned: Optional[Callable[["FileHistory"], None]] = None
 
-    def fill(self, commit: CommitWrapper, file_name: Optional[str] = None) -> None:
+    def fill(self, commit: CommitWrapper, file_name: Optional[str] = None,
+             change: Optional[Union[Diff, FileChange]] = None) -> None:
+        """Adds commit to the history. `change` is the file's diff in this
+        commit, or None if the commit doesn't touch it."""
         if not self._orig_file_name:
             self._orig_file_name = file_name
         self._current_file_name = file_name or self._current_file_name
@@ -141,37 +472,114 @@ class FileHistory:
         if not self._current_file_name:
             raise Exception("Missing file name")
 
-        self.file_commits[commit.hexsha] = FileCommit(self._current_file_name, commit)
+        if change is not None:
+            self._blob_sha = _blob_shas(change)[1]
+            file_commit = FileCommit(
+                self._current_file_name, commit, self.diff_cache, self._blob_sha)
+        else:
+            previous = next(reversed(self.file_commits.values()), None)
+            file_commit = FileCommit(
+                self._current_file_name, commit, self.diff_cache, self._blob_sha,
+                changed=False, previous=previous)
+        file_commit.placeholder = self.placeholder
+        self.file_commits[commit.hexsha] = file_commit
+        self._aligned = None
+
+    @property
+    def file_name(self) -> Optional[str]:
+        return self._current_file_name
+
+    def mark(self, reason: str) -> None:
+        """Shows the file as a placeholder, without loading any more of its
+        content."""
+        if self.placeholder:
+            return
+        self.placeholder = reason
+        for fc in self.file_commits.values():
+            if not fc.loaded:
+                fc.placeholder = reason
+        self._aligned = None
+
+    def materialize(self) -> None:
+        """Loads the diff text of every commit in this history and aligns it."""
+        for fc in self.file_commits.values():
+            fc.load()
+            if fc.placeholder:
+                self.mark(fc.placeholder)
+        self.get_aligned()
+
+    @property
+    def materialized(self) -> bool:
+        return self._aligned is not None
+
+    @property
+    def aligned_nbytes(self) -> int:
+        aligned = self._aligned
+        return aligned.nbytes if aligned is not None else 0
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the loaded and aligned lines, counting content shared
+        between commits once."""
+        # Read _diff_text directly: the diff_text property would load it
+        loaded = [fc._diff_text for fc in self.file_commits.values()]
+        unique = {id(lines): lines.nbytes for lines in loaded if lines is not None}
+        return sum(unique.values()) + self.aligned_nbytes
+
+    def evict(self) -> None:
+        """Unloads the file and drops its lines from the DiffCache too, so
+        only the interned text stays behind. materialize() rebuilds it all."""
+        self.unload()
+        self.diff_cache.forget(self.file_commits.values())
+
+    def release_aligned(self) -> None:
+        """Drops the aligned snapshot but keeps loaded content, so the next
+        materialize() only realigns."""
+        self._aligned = None
+
+    def reuse(self, file_commits: Dict[Tuple[str, str], FileCommit]) -> None:
+        """Swaps in FileCommits from an earlier load, by (sha, file name),
+        so surviving commits keep their loaded content."""
+        previous: Optional[FileCommit] = None
+        for sha, fc in list(self.file_commits.items()):
+            old = file_commits.get((sha, fc.file_name))
+            if old is not None and old.changed == fc.changed:
+                fc = self.file_commits[sha] = old
+            elif not fc.changed:
+                fc.previous = previous
+            previous = fc
+
+    def update(self, other: "FileHistory") -> None:
+        """Takes over the commits of `other`, a rebuilt history of the same
+        file. The aligned snapshot is kept if they're unchanged."""
+        if list(self.file_commits.values()) != list(other.file_commits.values()):
+            self._aligned = None
+        self.file_commits = other.file_commits
+        self._orig_file_name = other._orig_file_name
+        self._current_file_name = other._current_file_name
+        self._blob_sha = other._blob_sha
+        self.placeholder = other.placeholder
+
+    def unload(self) -> None:
+        """Drops loaded content and the aligned snapshot, which the next
+        materialize() rebuilds."""
+        for fc in self.file_commits.values():
+            fc.unload()
+        self._aligned = None
+
+    def get_aligned(self) -> "AlignedHistory":
+        aligned = self._aligned
+        if aligned is None:
+            aligned = self._aligned = AlignedHistory(self.file_commits, self.diff_cache.profiler)
+            if self.on_aligned is not None:
+                self.on_aligned(self)
+        return aligned
 
     def get_all_patches(self) -> OrderedDict[str, List[PatchInfo]]:
-        all_patches: OrderedDict[str, List[PatchInfo]] = OrderedDict()
-        for i, (commit, fc) in enumerate(self.file_commits.items()):
-            if i < len(self.file_commits):
-                for p in fc.get_patches():
-                    if p.type == PatchType.DELETE:
-                        for fc_ in list(self.file_commits.values())[i+1:]:
-                            for p_ in fc_.get_patches():
-                                if p_.line_start > p.line_start:
-                                    p_len = p.line_end - p.line_start
-                                    p_.line_start += p_len
-                                    p_.line_end += p_len
-
-
-            all_patches[commit] = fc.get_patches()
-        return all_patches
+        return self.get_aligned().all_patches
 
     def get_total_length(self) -> int:
-        first_commit = list(self.file_commits.keys())[0]
-        first_len = len(self.file_commits[first_commit].diff_text or "")
-        extra = 0
-        for i, patches in enumerate(self.get_all_patches().values()):
-            if i == 0:
-                continue
-            for patch in patches:
-                if patch.type == PatchType.ADD:
-                    extra += patch.line_end - patch.line_start
-
-        return first_len + extra
+        return self.get_aligned().total_length
 
     def __str__(self) -> str:
         return (f"File history: {self._orig_file_name}, "
@@ -180,34 +588,199 @@ class FileHistory:
     def __repr__(self) -> str:
         return str(self)
 
+class AlignedHistory:
+    """Aligned patches and padded content of a FileHistory.
+
+    Built once per FileHistory and shared by every pane showing it. A later
+    FileHistory.fill() replaces the snapshot instead of changing it.
+    """
+    def __init__(self, file_commits: OrderedDict[str, FileCommit],
+                 profiler: Optional[AnyProfiler] = None):
+        self.file_commits = OrderedDict(file_commits)
+        self.profiler = profiler or NullProfiler()
+        diffs = [
+            (len(fc.diff_text),
+             [(p.type.value, p.line_start, p.line_end) for p in fc.get_patches()])
+            for fc in self.file_commits.values()
+        ]
+        self.file_name = next(reversed(self.file_commits.values())).file_name if file_commits else None
+        with self.profiler.span("align", file=self.file_name):
+            aligned, self.total_length = align(diffs)
+
+        self.all_patches: OrderedDict[str, List[PatchInfo]] = OrderedDict()
+        for sha, patches in zip(self.file_commits.keys(), aligned):
+            self.all_patches[sha] = [PatchInfo(PatchType(patch_type), line_start, line_end)
+                                     for patch_type, line_start, line_end in patches]
+        self._lines: Dict[str, PooledLines] = {}
+        self._search_index: Optional[SearchIndex] = None
+        self._word_diffs: Dict[str, WordDiff] = {}
+        self._word_pairs: PairCache = {}
+
+    def get_lines(self, sha: str) -> PooledLines:
+        lines = self._lines.get(sha)
+        if lines is None:
+            file_commit = self.file_commits[sha]
+            with self.profiler.span("content", file=self.file_name, commit=file_commit.commit.short):
+                lines = file_commit.get_lines(self.all_patches, self.total_length)
+            self._lines[sha] = lines
+        return lines
+
+    def get_content(self, sha: str) -> str:
+        return self.get_lines(sha).text
+
+    def get_word_diff(self, sha: str) -> WordDiff:
+        word_diff = self._word_diffs.get(sha)
+        if word_diff is None:
+            word_diff = self._word_diffs[sha] = WordDiff(self.get_lines(sha), self._word_pairs)
+        return word_diff
+
+    @property
+    def nbytes(self) -> int:
+        return sum(lines.nbytes for lines in self._lines.values())
+
+    def get_search_index(self) -> SearchIndex:
+        """Built on the first search and kept until the file is realigned."""
+        index = self._search_index
+        if index is None:
+            with self.profiler.span("search index", file=self.file_name):
+                index = self._search_index = SearchIndex(
+                    OrderedDict((sha, self.get_lines(sha)) for sha in self.file_commits))
+        return index
+
 class GitData:
-    def __init__(self, repo_path: str, base_ref: str = "main"):
+    def __init__(self, repo_path: str, base_ref: str = "main", use_cache: bool = False,
+                 lazy: bool = False, streaming: bool = False,
+                 progress: Optional[ProgressCallback] = None, jobs: int = 1,
+                 max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE,
+                 profiler: Optional[Profiler] = None,
+                 max_aligned_size: Optional[int] = DEFAULT_MAX_ALIGNED_SIZE,
+                 max_memory: Optional[int] = None, diff_algorithm: Optional[str] = None):
         self.repo_path = repo_path
         self.base_ref = base_ref
+        self.use_cache = use_cache
+        self.lazy = lazy
+        self.streaming = streaming
+        self.progress = progress
+        self.jobs = jobs
+        self.max_file_size = max_file_size
+        self.max_aligned_size = max_aligned_size
+        self.max_memory = max_memory
+        self.profiler: AnyProfiler = profiler or NullProfiler()
         self.commits: List[CommitWrapper] = []
         self.file_histories: OrderedDict[str, FileHistory] = OrderedDict()
+        self.file_index = FileIndex([], [], [])
+        # A lazy GitData loads files one at a time, so it diffs them one at a time
+        self.diff_cache = DiffCache(profiler=self.profiler, algorithm=diff_algorithm,
+                                    per_path=lazy)
+        self.line_pool = self.diff_cache.pool
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rediff-prefetch")
+        # Lazily materialized histories, least recently used first
+        self._lru: OrderedDict[FileHistory, None] = OrderedDict()
+        self._lru_lock = threading.Lock()
         self.load(repo_path, base_ref)
 
     def load(self, repo_path: str, base_ref: str) -> None:
-        repo = Repo(repo_path)
-        branch_commits = list(repo.iter_commits(f'{base_ref}..HEAD'))[::-1]
+        repo = self.repo = Repo(repo_path)
+        self._refs = self._resolve_refs()
 
-        commits = []
+        if self.use_cache:
+            self._open_disk_cache()
 
-        for commit_ in branch_commits:
-            commit = CommitWrapper(commit_)
+        with self.profiler.span("list commits"):
+            if self.streaming:
+                commits = self._load_commits_streaming(repo, base_ref)
+            else:
+                commits = self._load_commits(repo, base_ref)
 
-            if len(commit_.parents) > 1:
-                raise Exception(f"Merge commit found: {commit_}")
-            diffs = commit_.parents[0].diff(commit_) if commit_.parents else commit_.diff(NULL_TREE)
+        self.commits = commits
 
-            for file_diff in diffs:
-                commit.changed_files.append(file_diff)
+        with self.profiler.span("fill histories", commits=len(commits)):
+            self.file_histories = self._fill_histories(commits)
+            self.file_index = self._index_files(self.file_histories)
 
-            commits.append(commit)
+        if not self.lazy:
+            self.prefill_diffs()
+            for i, fh in enumerate(self.file_histories.values()):
+                aligned = fh.get_aligned()
+                for sha in fh.file_commits.keys():
+                    aligned.get_lines(sha) # exercise this code
+                self._report("files", i + 1, len(self.file_histories))
 
-        self.commits = commits
+            self._flush_disk_cache()
+
+    def refs_changed(self) -> bool:
+        """Whether HEAD or base_ref moved since the last load."""
+        return self._resolve_refs() != self._refs
+
+    def reload(self) -> bool:
+        """Catches up with an amend, rebase or new base_ref.
+
+        The commit list is read again. Commits whose sha survived keep their
+        CommitWrapper, diffs and FileCommits, and FileHistory objects of files
+        still in the branch are updated in place. Returns False if nothing
+        moved.
+        """
+        refs = self._resolve_refs()
+        if refs == self._refs:
+            return False
+
+        with self.diff_cache.lock, self.profiler.span("reload"):
+            self._refs = refs
+            if self.use_cache:
+                self._open_disk_cache()
+
+            old_commits = {commit.hexsha: commit for commit in self.commits}
+            commits = self._load_commits(self.repo, self.base_ref, old_commits)
+            old_file_commits = {
+                (fc.sha, fc.file_name): fc
+                for fh in self.file_histories.values() for fc in fh.file_commits.values()
+            }
 
+            file_histories = self._fill_histories(commits)
+            for path, fh in file_histories.items():
+                fh.reuse(old_file_commits)
+                old_fh = self.file_histories.get(path)
+                if old_fh is not None:
+                    old_fh.update(fh)
+                    file_histories[path] = old_fh
+
+            self.commits = commits
+            self.file_histories = file_histories
+            self.file_index = self._index_files(file_histories)
+            self.diff_cache.retain({commit.hexsha for commit in commits})
+            with self._lru_lock:
+                remaining = set(file_histories.values())
+                for fh in [fh for fh in self._lru if fh not in remaining]:
+                    del self._lru[fh]
+        return True
+
+    def close(self) -> None:
+        """Stops the prefetch thread, the `git cat-file` processes and the
+        disk cache. The GitData can't load anything afterwards."""
+        self._prefetcher.shutdown(cancel_futures=True)
+        with self.diff_cache.lock:
+            self.diff_cache.close()
+            if self.diff_cache.disk_cache:
+                self.diff_cache.disk_cache.close()
+                self.diff_cache.disk_cache = None
+            self.repo.close()
+
+    def _resolve_refs(self) -> Tuple[str, ...]:
+        return tuple(self.repo.git.rev_parse('HEAD', self.base_ref).split())
+
+    def _open_disk_cache(self) -> None:
+        merge_base = self.repo.merge_base(self.base_ref, 'HEAD')[0].hexsha
+        # Diffs from another algorithm align differently, so they're kept apart
+        if self.diff_cache.algorithm:
+            merge_base += f":{self.diff_cache.algorithm}"
+        disk_cache = self.diff_cache.disk_cache
+        if disk_cache and disk_cache.merge_base == merge_base:
+            return
+        if disk_cache:
+            disk_cache.close()
+        self.diff_cache.disk_cache = DiskCache(str(self.repo.git_dir), merge_base)
+
+    def _fill_histories(self, commits: List[CommitWrapper]) -> OrderedDict[str, FileHistory]:
         ## Load File Histories
         file_histories: OrderedDict[str, FileHistory] = OrderedDict()
         fh = None
@@ -216,14 +789,19 @@ class GitData:
 
             # Populate file histories for files that were changed in this commit
             for cfile in commit.changed_files:
+                placeholder = self._placeholder(cfile)
+                if placeholder and not isinstance(cfile, FileChange):
+                    self.diff_cache.exclude((cfile.a_path, cfile.b_path))
+
                 if cfile.new_file:
-                    fh = FileHistory()
-                    # First time seeing this file. Populate earlier history.
+                    fh = FileHistory(self.diff_cache, NULL_SHA)
+                    # First time seeing this file. Populate earlier history,
+                    # in which it doesn't exist yet.
                     for c_inner in commits:
                         if c_inner == commit:
                             break
-                        fh.fill(c_inner, None)
-                    fh.fill(commit, cfile.b_path)
+                        fh.fill(c_inner, cfile.b_path)
+                    fh.fill(commit, cfile.b_path, cfile)
                     assert isinstance(cfile.b_path, str)
                     file_histories[cfile.b_path] = fh
 
@@ -232,69 +810,425 @@ class GitData:
                     assert isinstance(cfile.b_path, str)
                     fh = file_histories.get(cfile.b_path)
                     if not fh:
-                        fh = FileHistory()
+                        fh = FileHistory(self.diff_cache, _blob_shas(cfile)[0])
                         # First time seeing this file. Populate earlier history.
                         for c_inner in commits:
                             if c_inner == commit:
                                 break
                             fh.fill(c_inner, cfile.b_path)
-                        fh.fill(commit, cfile.b_path)
+                        fh.fill(commit, cfile.b_path, cfile)
                         file_histories[cfile.b_path] = fh
                     else:
-                        fh.fill(commit, cfile.b_path)
+                        fh.fill(commit, cfile.b_path, cfile)
 
                 elif cfile.deleted_file:
                     assert isinstance(cfile.a_path, str)
                     fh = file_histories.get(cfile.a_path)
                     if not fh:
-                        fh = FileHistory()
+                        fh = FileHistory(self.diff_cache, _blob_shas(cfile)[0])
                         # First time seeing this file. Populate earlier history.
                         for c_inner in commits:
                             if c_inner == commit:
                                 break
                             fh.fill(c_inner, cfile.a_path)
-                        fh.fill(commit, cfile.b_path)
+                        fh.fill(commit, cfile.b_path, cfile)
                         assert isinstance(cfile.b_path, str)
                         file_histories[cfile.b_path] = fh
                     else:
-                        fh.fill(commit, cfile.a_path)
+                        fh.fill(commit, cfile.a_path, cfile)
 
-                elif cfile.renamed:
+                elif cfile.renamed_file:
                     assert isinstance(cfile.a_path, str)
                     fh = file_histories.get(cfile.a_path)
                     if not fh:
-                        fh = FileHistory()
+                        fh = FileHistory(self.diff_cache, _blob_shas(cfile)[0])
                         fh._orig_file_name = cfile.a_path
                         # First time seeing this file. Populate earlier history.
                         for c_inner in commits:
                             if c_inner == commit:
                                 break
                             fh.fill(c_inner, cfile.a_path)
-                        fh.fill(commit, cfile.b_path)
+                        fh.fill(commit, cfile.b_path, cfile)
                         file_histories[cfile.a_path] = fh
                     else:
-                        fh.fill(commit, cfile.b_path)
+                        fh.fill(commit, cfile.b_path, cfile)
 
                 else:
                     raise Exception("Unhandled change type")
 
+                if placeholder:
+                    fh.mark(placeholder)
+
             # Populate file histories for files that weren't changed in this commit
             for fh in file_histories.values():
                 if not fh.file_commits.get(commit.hexsha):
                     fh.fill(commit)
 
+        if self.lazy:
+            # However a file gets loaded, it counts towards the memory budget
+            for fh in file_histories.values():
+                fh.on_aligned = self._on_aligned
+        return file_histories
+
+    def _index_files(self, file_histories: OrderedDict[str, FileHistory]) -> FileIndex:
+        names = []
+        stats = []
         for fh in file_histories.values():
-            all_patches = fh.get_all_patches()
-            total_length = fh.get_total_length()
-            for fc in fh.file_commits.values():
-                fc.get_content(all_patches, total_length) # exercise this code
+            name = fh.file_name or ""
+            renamed_from = fh._orig_file_name if fh._orig_file_name != name else None
+            changed = sum(fc.changed for fc in fh.file_commits.values())
+            names.append(name)
+            stats.append(FileStats(changed, renamed_from, fh.placeholder))
+        return FileIndex(list(file_histories.keys()), names, stats)
+
+    def _load_commits(self, repo: Repo, base_ref: str,
+                      known: Optional[Dict[str, CommitWrapper]] = None) -> List[CommitWrapper]:
+        """Lists the branch's commits and their changed files. Commits in
+        `known` are reused as they are."""
+        branch_commits = list(repo.iter_commits(f'{base_ref}..HEAD'))[::-1]
+
+        commits = []
+
+        for commit_ in branch_commits:
+            if known and commit_.hexsha in known:
+                commits.append(known[commit_.hexsha])
+                self._report("commits", len(commits), len(branch_commits))
+                continue
+
+            commit = CommitWrapper(commit_)
+
+            if len(commit_.parents) > 1:
+                raise Exception(f"Merge commit found: {commit_}")
+            with self.profiler.span("changed files", commit=commit.short):
+                diffs = commit_.parents[0].diff(commit_) if commit_.parents else commit_.diff(NULL_TREE)
+
+            for file_diff in diffs:
+                commit.changed_files.append(file_diff)
+
+            commits.append(commit)
+            self._report("commits", len(commits), len(branch_commits))
+
+        return commits
+
+    def _load_commits_streaming(self, repo: Repo, base_ref: str) -> List[CommitWrapper]:
+        """Loads commits, changed files and every file diff from one
+        `git log -p` process, filling the DiffCache as it goes."""
+        commits = []
+
+        for log_commit in iter_log(self.repo_path, f'{base_ref}..HEAD',
+                                   max_file_size=self.max_file_size):
+            if len(log_commit.parents) > 1:
+                raise Exception(f"Merge commit found: {log_commit.hexsha}")
+            commit_ = Commit(
+                repo,
+                hex_to_bin(log_commit.hexsha),
+                message=log_commit.message,
+                parents=[Commit(repo, hex_to_bin(p)) for p in log_commit.parents],
+            )
+            commit = CommitWrapper(commit_)
+            commit.changed_files.extend(log_commit.changed_files)
+
+            if log_commit.parents:
+                self.diff_cache.put(log_commit.parents[0], log_commit.hexsha, log_commit.file_diffs)
+
+            commits.append(commit)
+            self._report("commits", len(commits), 0)
+
+        return commits
+
+    def _placeholder(self, change: Union[Diff, FileChange]) -> Optional[str]:
+        """Why a changed file can't be shown, if it can't. Binary files
+        loaded through GitPython are only found once their diff is read."""
+        if isinstance(change, FileChange):
+            if change.binary:
+                return BINARY_FILE
+            if change.truncated:
+                return f"File too large to show (over {_format_size(self.max_file_size or 0)})"
+            return None
+
+        if not self.max_file_size:
+            return None
+        size = max((blob.size for blob in (change.a_blob, change.b_blob) if blob), default=0)
+        if size > self.max_file_size:
+            return (f"File too large to show "
+                    f"({_format_size(size)}, over {_format_size(self.max_file_size)})")
+        return None
+
+    def prefill_diffs(self, commits: Optional[Sequence[CommitWrapper]] = None) -> None:
+        """Extracts the diffs of commits, every commit by default, up front
+        over `jobs` processes.
+
+        The streaming loader has already read them all from `git log`."""
+        if self.jobs > 1 and not self.streaming:
+            self.diff_cache.prefill(self.repo_path, list(self.commits if commits is None else commits), self.jobs)
+
+    def get_file_history(self, file_no: int,
+                         on_prefetched: Optional[Callable[[FileHistory], None]] = None) -> FileHistory:
+        """The file's history, loaded and aligned. In lazy mode the next and
+        previous files are then prefetched in the background, and passed to
+        on_prefetched, on the prefetch thread, once ready to show."""
+        file_history = self.file_histories[self.file_index.path(file_no)]
+        if not file_history.materialized:
+            file_history.materialize()
+            self._flush_disk_cache()
+        self._touch(file_history)
+
+        if self.lazy:
+            for neighbour in (file_no + 1, file_no - 1):
+                if 0 <= neighbour < len(self.file_histories):
+                    self._prefetcher.submit(self._prefetch, neighbour, on_prefetched)
+
+        return file_history
+
+    def _prefetch(self, file_no: int,
+                  on_prefetched: Optional[Callable[[FileHistory], None]]) -> None:
+        self.materialize(file_no)
+        file_history = self.file_histories[self.file_index.path(file_no)]
+        if not file_history.placeholder:
+            aligned = file_history.get_aligned()
+            for sha in file_history.file_commits:
+                aligned.get_lines(sha)
+        if on_prefetched is not None:
+            on_prefetched(file_history)
+
+    def materialize(self, file_no: int) -> None:
+        """Loads and aligns a file's history without returning it, e.g. to
+        prefetch it. This doesn't count as viewing the file."""
+        file_history = self.file_histories[self.file_index.path(file_no)]
+        if not file_history.materialized:
+            file_history.materialize()
+            self._flush_disk_cache()
+
+    def evict(self, file_history: FileHistory) -> None:
+        """Unloads a file, its lines in the DiffCache included, and stops
+        counting it towards the memory budget until it's loaded again."""
+        with self._lru_lock:
+            self._lru.pop(file_history, None)
+        file_history.evict()
+
+    def reset_line_pool(self) -> bool:
+        """Swaps in an empty LinePool, freeing the interned text, if no file
+        or DiffCache lines still refer to it. Returns whether it did.
+
+        Ids from the old pool, e.g. cached by a Highlighter, mean nothing in
+        the new one, so this is for callers that load a file at a time."""
+        with self.diff_cache.lock:
+            if self.diff_cache.nbytes or any(fh.nbytes for fh in self.file_histories.values()):
+                return False
+            self.diff_cache.pool = self.line_pool = LinePool()
+            return True
+
+    def _on_aligned(self, file_history: FileHistory) -> None:
+        # Loaded without being viewed: prefetched, or rebuilt for a pane
+        self._touch(file_history, viewed=False)
+
+    def _touch(self, file_history: FileHistory, viewed: bool = True) -> None:
+        """Marks a file as just viewed, then makes room, least recently
+        viewed files first: aligned snapshots are released past
+        max_aligned_size, and whole files evicted past max_memory.
+
+        A file loaded without being viewed joins the least recently viewed
+        end instead. Neither it nor the file viewed last is given up."""
+        evicted = []
+        with self._lru_lock:
+            lru = self._lru
+            if viewed or file_history not in lru:
+                lru[file_history] = None
+                lru.move_to_end(file_history, last=viewed)
+            keep = {file_history, next(reversed(lru))}
+
+            if self.max_aligned_size is not None:
+                aligned_size = sum(fh.aligned_nbytes for fh in lru)
+                for fh in list(lru):
+                    if aligned_size <= self.max_aligned_size:
+                        break
+                    if fh not in keep:
+                        aligned_size -= fh.aligned_nbytes
+                        fh.release_aligned()
+
+            if self.max_memory is not None:
+                used = self.memory_used()
+                for fh in list(lru):
+                    if used <= self.max_memory:
+                        break
+                    if fh not in keep:
+                        del lru[fh]
+                        used -= fh.nbytes
+                        evicted.append(fh)
+
+        # Outside _lru_lock, as reload() takes the DiffCache lock first
+        for fh in evicted:
+            fh.evict()
+
+    def memory_used(self) -> int:
+        """Rough bytes held for loaded files: their lines and aligned
+        snapshots, and the DiffCache. Lines held by both a file and the
+        DiffCache count twice, erring on the side of evicting.
+
+        The interned text in line_pool isn't counted: evicting a file can't
+        free it, so counting it would only evict files to no effect. A lazy
+        GitData interns one file's text at a time, as files are loaded."""
+        return self.diff_cache.nbytes + sum(fh.nbytes for fh in self._lru)
+
+    def _report(self, stage: str, done: int, total: int) -> None:
+        if self.progress:
+            self.progress(stage, done, total)
+
+    def _flush_disk_cache(self) -> None:
+        if self.diff_cache.disk_cache:
+            with self.diff_cache.lock:
+                self.diff_cache.disk_cache.flush()
+
+def _diff_commit(parent_commit: Commit, commit: Commit,
+                 excluded_paths: Iterable[str] = (), only_paths: Iterable[str] = ()) -> FileDiffs:
+    file_diffs: FileDiffs = {}
+    paths = (tuple(f":(literal){path}" for path in sorted(only_paths))
+             + tuple(f":(exclude,literal){path}" for path in sorted(excluded_paths)))
+    all_diff_wrappers = parent_commit.diff(
+        commit, paths=paths or None, create_patch=True, unified=999999)
+    for diff_w in all_diff_wrappers:
+        file_name = diff_w.b_path or diff_w.a_path
+        assert isinstance(file_name, str)
+        parent_file_name = diff_w.rename_from if diff_w.renamed_file else file_name
+        assert isinstance(parent_file_name, str)
+        patch = diff_w.diff or b''
+        if isinstance(patch, bytes) and patch.startswith(b'Binary files '):
+            file_diffs[file_name] = (parent_file_name, None)
+        else:
+            file_diffs[file_name] = (
+                parent_file_name, _parse_patch(_utf_decode(patch, errors='replace')))
+    return file_diffs
+
+def _diff_blobs(pool: LinePool, reader: BlobReader,
+                changes: Iterable[Union[Diff, FileChange]], excluded_paths: Set[str],
+                algorithm: str) -> Dict[str, Tuple[str, Optional[PooledLines]]]:
+    """Diffs the blobs of each changed file with rediff.linediff."""
+    file_diffs: Dict[str, Tuple[str, Optional[PooledLines]]] = {}
+    for change in changes:
+        if change.a_path in excluded_paths or change.b_path in excluded_paths:
+            continue
+        a_sha, b_sha = _blob_shas(change)
+        if a_sha is None or b_sha is None:
+            # A rename git printed no shas for: the content didn't change
+            continue
+        file_name = change.b_path or change.a_path
+        assert isinstance(file_name, str)
+        parent_file_name = change.a_path if change.renamed_file else file_name
+        assert isinstance(parent_file_name, str)
+
+        a_data = reader.read(a_sha) if a_sha != NULL_SHA else b''
+        b_data = reader.read(b_sha) if b_sha != NULL_SHA else b''
+        if a_data is None or b_data is None or _is_binary(a_data) or _is_binary(b_data):
+            # Missing objects are submodule commits, which have no text either
+            file_diffs[file_name] = (parent_file_name, None)
+            continue
+        file_diffs[file_name] = (parent_file_name, diff_blobs(pool, a_data, b_data, algorithm))
+    return file_diffs
+
+# Repo, excluded paths and diff algorithm of a DiffCache.prefill() worker
+# process, and its blob reader if it diffs in process
+_worker_repo: Optional[Repo] = None
+_worker_excluded_paths: Set[str] = set()
+_worker_algorithm: Optional[str] = None
+_worker_reader: Optional[BlobReader] = None
+
+def _init_diff_worker(repo_path: str, excluded_paths: Set[str],
+                      algorithm: Optional[str] = None) -> None:
+    global _worker_repo, _worker_excluded_paths, _worker_algorithm, _worker_reader
+    _worker_repo = Repo(repo_path)
+    _worker_excluded_paths = excluded_paths
+    _worker_algorithm = algorithm
+    _worker_reader = BlobReader(str(_worker_repo.git_dir)) if algorithm else None
+    if _worker_reader is not None:
+        # Pool processes exit without running atexit handlers, but do run these
+        multiprocessing.util.Finalize(_worker_reader, _worker_reader.close, exitpriority=0)
+
+def _diff_commit_worker(parent_sha: str, sha: str) -> Tuple[FileDiffs, Dict[str, List[Patch]]]:
+    assert _worker_repo is not None
+    parent_commit, commit = _worker_repo.commit(parent_sha), _worker_repo.commit(sha)
+    if _worker_algorithm:
+        assert _worker_reader is not None
+        # Pool ids don't cross processes, so lines go back as text
+        pooled = _diff_blobs(LinePool(), _worker_reader, parent_commit.diff(commit),
+                             _worker_excluded_paths, _worker_algorithm)
+        file_diffs: FileDiffs = {
+            file_name: (parent_file_name, None if lines is None else list(lines))
+            for file_name, (parent_file_name, lines) in pooled.items()
+        }
+    else:
+        file_diffs = _diff_commit(parent_commit, commit, _worker_excluded_paths)
+    patches = {
+        file_name: [(p.type.value, p.line_start, p.line_end) for p in _parse_patches(lines)]
+        for file_name, (_, lines) in file_diffs.items() if lines is not None
+    }
+    return file_diffs, patches
+
+def _diffs_nbytes(file_diffs: Dict[str, Tuple[str, Optional[PooledLines]]]) -> int:
+    return sum(lines.nbytes for _, lines in file_diffs.values() if lines is not None)
+
+def _blob_shas(change: Union[Diff, FileChange]) -> Tuple[Optional[str], Optional[str]]:
+    """The file's (before, after) blob shas in a change."""
+    if isinstance(change, FileChange):
+        return change.a_blob_sha, change.b_blob_sha
+    return (change.a_blob.hexsha if change.a_blob else NULL_SHA,
+            change.b_blob.hexsha if change.b_blob else NULL_SHA)
+
+def _parse_patches(diff_text: Sequence[str]) -> List[PatchInfo]:
+    patches: List[PatchInfo] = []
+    patch_add = patch_del = None
+
+    def finish_patch(patch_type, patch_start, line_no):
+        if patch_start is not None:
+            patches.append(PatchInfo(patch_type, patch_start, line_no))
+        return None
+
+    for line_no, line in enumerate(diff_text):
+        if line.startswith('+'):
+            patch_del = finish_patch(PatchType.DELETE, patch_del, line_no)
+            if patch_add is None:
+                patch_add = line_no
+        elif line.startswith('-'):
+            patch_add = finish_patch(PatchType.ADD, patch_add, line_no)
+            if patch_del is None:
+                patch_del = line_no
+        else:
+            patch_add = finish_patch(PatchType.ADD, patch_add, line_no)
+            patch_del = finish_patch(PatchType.DELETE, patch_del, line_no)
+
+    finish_patch(PatchType.ADD, patch_add, len(diff_text))
+    finish_patch(PatchType.DELETE, patch_del, len(diff_text))
+
+    return patches
+
+def _parse_patch(patch: str) -> List[str]:
+    """Drops hunk headers and "no newline" markers from a unified diff,
+    splitting its lines like file content, see split_diff_line()."""
+    lines: List[str] = []
+    patch_lines = patch.split('\n')
+    for i, line in enumerate(patch_lines):
+        if not line or line.startswith(('@@', '\\')):
+            continue
+        newline = not (i + 1 < len(patch_lines) and patch_lines[i + 1].startswith('\\'))
+        lines.extend(split_diff_line(line, newline))
+    return lines
+
+def _is_binary(data: bytes) -> bool:
+    return b'\0' in data[:BINARY_CHECK_SIZE]
 
-        self.file_histories = file_histories
+def _decode_lines(data: bytes) -> List[str]:
+    return data.decode('utf-8', errors='replace').splitlines()
 
-    def get_file_history(self, file_no: int) -> FileHistory:
-        return self.file_histories[list(self.file_histories.keys())[file_no]]
+def _format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    scaled = size / 1024
+    for unit in ("KB", "MB"):
+        if scaled < 1024:
+            return f"{scaled:.1f} {unit}"
+        scaled /= 1024
+    return f"{scaled:.1f} GB"
 
-def _utf_decode(text: Union[str, bytes]) -> str:
+def _utf_decode(text: Union[str, bytes], errors: str = 'strict') -> str:
     if isinstance(text, bytes):
-        return text.decode('utf-8')
+        return text.decode('utf-8', errors)
     return text
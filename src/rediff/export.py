@@ -0,0 +1,105 @@
+import html
+import json
+from typing import Any, Dict, Iterator, List
+
+from rediff.db import CommitWrapper, FileHistory, GitData
+
+# Row classes in the HTML export, by line prefix
+ROW_CLASSES = {" ": "ctx", "+": "add", "-": "del", "x": "gap"}
+
+HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>rediff {title}</title>
+<style>
+body {{ font-family: sans-serif; }}
+table {{ border-collapse: collapse; font-family: monospace; font-size: 12px; }}
+th {{ text-align: left; vertical-align: top; padding: 2px 8px; }}
+td {{ white-space: pre; padding: 0 8px; border-left: 1px solid #ddd; }}
+td.add {{ background: #e6ffec; }}
+td.del {{ background: #ffebe9; }}
+td.gap {{ background: #f6f8fa; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+HTML_TAIL = "</body>\n</html>\n"
+
+def iter_files(gitdata: GitData) -> Iterator[FileHistory]:
+    """Materializes each file in turn, and evicts it again once the caller
+    is done with it, so only one file's content is held at a time.
+
+    With a lazy GitData only the file's own diffs are run, and its
+    interned text is dropped with it."""
+    for file_history in gitdata.file_histories.values():
+        file_history.materialize()
+        try:
+            yield file_history
+        finally:
+            gitdata.evict(file_history)
+            gitdata.reset_line_pool()
+
+def iter_jsonl(gitdata: GitData) -> Iterator[str]:
+    """A "branch" line listing the commits, then one "file" line per file
+    with each commit's aligned content and patch rows."""
+    yield json.dumps({
+        "type": "branch",
+        "base_ref": gitdata.base_ref,
+        "commits": [_commit_json(commit) for commit in gitdata.commits],
+    }) + "\n"
+
+    for file_history in iter_files(gitdata):
+        record: Dict[str, Any] = {
+            "type": "file",
+            "file": file_history.file_name,
+            "placeholder": file_history.placeholder,
+        }
+        if not file_history.placeholder:
+            aligned = file_history.get_aligned()
+            record["total_length"] = aligned.total_length
+            record["commits"] = [
+                {
+                    "sha": sha,
+                    "file_name": aligned.file_commits[sha].file_name,
+                    "patches": [[p.type.value, p.line_start, p.line_end] for p in patches],
+                    "content": list(aligned.get_lines(sha)),
+                }
+                for sha, patches in aligned.all_patches.items()
+            ]
+        yield json.dumps(record) + "\n"
+
+def iter_html(gitdata: GitData) -> Iterator[str]:
+    """A static page with one table per file and one column per commit."""
+    yield HTML_HEAD.format(title=html.escape(f"{gitdata.base_ref}..HEAD"))
+
+    for file_history in iter_files(gitdata):
+        yield f"<section>\n<h2>{html.escape(file_history.file_name or '')}</h2>\n"
+        if file_history.placeholder:
+            yield f"<p>{html.escape(file_history.placeholder)}</p>\n</section>\n"
+            continue
+
+        aligned = file_history.get_aligned()
+        file_commits = list(aligned.file_commits.values())
+        yield "<table>\n<tr>"
+        for fc in file_commits:
+            yield (f"<th>{html.escape(fc.commit.short)}<br>"
+                   f"{html.escape(fc.commit.summary)}<br>{html.escape(fc.file_name)}</th>")
+        yield "</tr>\n"
+
+        columns = [aligned.get_lines(fc.sha) for fc in file_commits]
+        for row in zip(*columns):
+            cells: List[str] = []
+            for line in row:
+                row_class = ROW_CLASSES.get(line[:1], "ctx")
+                text = "" if row_class == "gap" else line[1:]
+                cells.append(f'<td class="{row_class}">{html.escape(text)}</td>')
+            yield "<tr>" + "".join(cells) + "</tr>\n"
+        yield "</table>\n</section>\n"
+
+    yield HTML_TAIL
+
+def _commit_json(commit: CommitWrapper) -> Dict[str, str]:
+    return {"sha": commit.hexsha, "short": commit.short, "summary": commit.summary}
@@ -1,15 +1,22 @@
-from typing import Dict, List, Optional, Tuple, OrderedDict
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
 from textual import events
+from textual.geometry import Region
 from textual.widgets import TextArea, _text_area
 from textual.document._document import _utf8_encode
 from textual.strip import Strip
 from textual.message import Message
+from textual.reactive import Reactive, reactive
+from textual.widgets.text_area import Selection
 from rich.style import Style
 from rich.text import Text
 
-from rediff.db import FileCommit, PatchInfo
+from rediff.db import AlignedHistory, FileCommit
+from rediff.highlight import Highlighter
+from rediff.lines import PLACEHOLDER
+from rediff.viewport import ViewportModel
 
 class Cmd(str, Enum):
     FOCUS_PANE_LEFT = "focus_pane_left"
@@ -17,20 +24,70 @@ class Cmd(str, Enum):
     FOCUS_FILE_PREV = "focus_file_prev"
     FOCUS_FILE_NEXT = "focus_file_next"
     CURSOR_MOVE = "cursor_move"
+    SEARCH = "search"
+    SEARCH_NEXT = "search_next"
+    SEARCH_PREV = "search_prev"
+    FIND_FILE = "find_file"
 
 class FileDiffView(TextArea):
+    STRIP_CACHE_SIZE = 1024
+    # Rows above and below the view that are lexed ahead of scrolling, in screens
+    HIGHLIGHT_MARGIN = 1
+
+    # Repainting on every selection change would redraw every row, so
+    # _watch_selection refreshes just the rows it touched.
+    selection: Reactive[Selection] = reactive(
+        Selection(), always_update=True, init=False, repaint=False
+    )
+    show_cursor: Reactive[bool] = reactive(True, repaint=False)
+
     class ParentCommand(Message):
         def __init__(self, cmd: Cmd, data: Optional[Dict[str, Tuple[int, int]]] = None) -> None:
             super().__init__()
             self.cmd = cmd
             self.data = data
 
-    def __init__(self, file_commit: FileCommit, all_patches: OrderedDict[str, List[PatchInfo]], total_length: int):
+    def __init__(self, file_commit: FileCommit, aligned: AlignedHistory,
+                 viewport: Optional[ViewportModel] = None,
+                 highlighter: Optional[Highlighter] = None):
+        self._strip_cache: OrderedDict[Tuple[int, int, int, int, Optional[str]], Strip] = OrderedDict()
+        # The selection _watch_selection last decorated
+        self._drawn_selection = Selection()
         super().__init__()
-        self.file_name = file_commit.file_name
+        self.highlighter = highlighter
+        self._set_commit(file_commit, aligned)
         self.show_line_numbers = False
-        self.text = file_commit.get_content(all_patches, total_length)
+        self.text = self.lines.text
         self.show_cursor = True
+        self.viewport = viewport
+
+    def on_mount(self) -> None:
+        if self.viewport:
+            self.viewport.subscribe(self.follow_viewport)
+            self.call_after_refresh(self.follow_viewport, self.viewport)
+
+    def on_unmount(self) -> None:
+        if self.viewport:
+            self.viewport.unsubscribe(self.follow_viewport)
+
+    def follow_viewport(self, viewport: ViewportModel) -> None:
+        """Moves to the shared cursor row and scroll offset, keeping this
+        pane's own cursor column."""
+        self.scroll_to(y=viewport.scroll_y, animate=False)
+        self.move_cursor((viewport.cursor_row, self.cursor_location[1]))
+
+    def show_commit(self, file_commit: FileCommit, aligned: AlignedHistory) -> None:
+        self._set_commit(file_commit, aligned)
+        self.load_text(self.lines.text)
+        if self.viewport:
+            self.follow_viewport(self.viewport)
+
+    def _set_commit(self, file_commit: FileCommit, aligned: AlignedHistory) -> None:
+        self.file_commit = file_commit
+        self.file_name = file_commit.file_name
+        self.lines = aligned.get_lines(file_commit.sha)
+        self.word_diff = aligned.get_word_diff(file_commit.sha)
+        self.lexer = self.highlighter.lexer_for(self.file_name) if self.highlighter else None
 
     def _on_key(self, event: events.Key):
         event.prevent_default()
@@ -39,14 +96,14 @@ class FileDiffView(TextArea):
             self.post_message(
                 self.ParentCommand(
                     Cmd.CURSOR_MOVE,
-                    {"location": self.get_cursor_down_location()}
+                    {"delta": (1, 0)}
                 ),
             )
         elif event.character == "k":
             self.post_message(
                 self.ParentCommand(
                     Cmd.CURSOR_MOVE,
-                    {"location": self.get_cursor_up_location()}
+                    {"delta": (-1, 0)}
                 ),
             )
         elif event.character == "h":
@@ -63,15 +120,88 @@ class FileDiffView(TextArea):
         elif event.character == "J":
             self.post_message(self.ParentCommand(Cmd.FOCUS_FILE_NEXT))
 
+        elif event.character == "/":
+            self.post_message(self.ParentCommand(Cmd.SEARCH))
+        elif event.character == "n":
+            self.post_message(self.ParentCommand(Cmd.SEARCH_NEXT))
+        elif event.character == "N":
+            self.post_message(self.ParentCommand(Cmd.SEARCH_PREV))
+        elif event.character == "f":
+            self.post_message(self.ParentCommand(Cmd.FIND_FILE))
+
+    def render_lines(self, crop: Region) -> List[Strip]:
+        with self.file_commit.diff_cache.profiler.span(
+                "render", file=self.file_name, commit=self.file_commit.commit.short):
+            if self.highlighter and self.lexer:
+                # Lex the rows about to be drawn, and a margin for scrolling
+                margin = self.size.height * self.HIGHLIGHT_MARGIN
+                top = max(0, self.scroll_offset.y + crop.y - margin)
+                bottom = self.scroll_offset.y + crop.bottom + margin
+                self.highlighter.prepare(self.lexer, self._highlighted_ids(top, bottom))
+            return super().render_lines(crop)
+
+    def _highlighted_ids(self, top: int, bottom: int) -> List[int]:
+        lines = self.lines
+        return [lines.ids[row] for row in range(top, min(bottom, len(lines)))
+                if lines.kinds[row] != PLACEHOLDER]
+
     def render_line(self, widget_y: int) -> Strip:
         """Render a single line of the TextArea. Called by Textual.
 
+        Rows without the cursor, a selection or a matched bracket are served
+        from a strip cache. Those few decorated rows are rendered in full.
+
         Args:
             widget_y: Y Coordinate of line relative to the widget region.
 
         Returns:
             A rendered line.
         """
+        scroll_x, scroll_y = self.scroll_offset
+        line_index = widget_y + scroll_y
+        if line_index >= self.document.line_count or self._is_decorated(line_index):
+            return self._render_line(widget_y)
+
+        key = (line_index, self.size.width, self.virtual_size.width, scroll_x, self.theme)
+        strip = self._strip_cache.get(key)
+        if strip is None:
+            strip = self._render_line(widget_y)
+            self._strip_cache[key] = strip
+            if len(self._strip_cache) > self.STRIP_CACHE_SIZE:
+                self._strip_cache.popitem(last=False)
+        else:
+            self._strip_cache.move_to_end(key)
+        return strip
+
+    def _is_decorated(self, line_index: int) -> bool:
+        start, end = self.selection
+        if end[0] == line_index:
+            return True
+        if start != end:
+            selection_top, selection_bottom = sorted((start[0], end[0]))
+            if selection_top <= line_index <= selection_bottom:
+                return True
+        matching_bracket = self._matching_bracket_location
+        return matching_bracket is not None and matching_bracket[0] == line_index
+
+    def _watch_selection(self, selection: Selection) -> None:
+        previous_selection, self._drawn_selection = self._drawn_selection, selection
+        previous_bracket = self._matching_bracket_location
+        super()._watch_selection(selection)
+        # Only the rows that were or are decorated need repainting
+        rows = [location[0] for location in (*previous_selection, *selection)]
+        self.refresh_lines(min(rows), max(rows) - min(rows) + 1)
+        if previous_bracket is not None:
+            self.refresh_lines(previous_bracket[0])
+
+    def _watch_show_cursor(self) -> None:
+        self.refresh_lines(self.cursor_location[0])
+
+    def _set_document(self, text: str, language: Optional[str]) -> None:
+        self._strip_cache.clear()
+        super()._set_document(text, language)
+
+    def _render_line(self, widget_y: int) -> Strip:
         document = self.document
         scroll_x, scroll_y = self.scroll_offset
 
@@ -101,6 +231,19 @@ class FileDiffView(TextArea):
         elif line_string.startswith(" "):
             pass
 
+        if line_string[:1] in ("+", "-") and line_index < len(self.lines):
+            # Changed words, again skipping the prefix character
+            word_style = "bold on bright_green" if line_string[0] == "+" else "bold on bright_red"
+            for word_start, word_end in self.word_diff.ranges(line_index):
+                line.stylize(word_style, word_start + 1, word_end + 1)
+
+        if (self.highlighter and self.lexer and line_index < len(self.lines)
+                and self.lines.kinds[line_index] != PLACEHOLDER):
+            # Spans skip the prefix character
+            line_id = self.lines.ids[line_index]
+            for span_start, span_end, span_style in self.highlighter.spans(self.lexer, line_id):
+                line.stylize(span_style, span_start + 1, span_end + 1)
+
         line_character_count = len(line)
         line.tab_size = self.indent_width
         virtual_width, virtual_height = self.virtual_size
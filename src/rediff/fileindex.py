@@ -0,0 +1,78 @@
+import heapq
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+class FileStats:
+    """How much of the branch touches a file."""
+    def __init__(self, commits: int, renamed_from: Optional[str] = None,
+                 placeholder: Optional[str] = None):
+        self.commits = commits
+        self.renamed_from = renamed_from
+        self.placeholder = placeholder
+
+    def __str__(self) -> str:
+        text = f"{self.commits} commit{'s' if self.commits != 1 else ''}"
+        if self.renamed_from:
+            text += f", from {self.renamed_from}"
+        if self.placeholder:
+            text += f", {self.placeholder.lower()}"
+        return text
+
+class FileIndex:
+    """The files of a branch by position, with their change stats.
+
+    Built once per load from keys and names alone, so nothing is diffed to
+    list, look up or fuzzy find a file.
+    """
+    def __init__(self, paths: Sequence[str], names: Sequence[str], stats: Sequence[FileStats]):
+        # Keys of GitData.file_histories, in order
+        self.paths = list(paths)
+        # Current file names, which fuzzy matching uses
+        self.names = list(names)
+        self.stats = list(stats)
+        self.positions: Dict[str, int] = {path: i for i, path in enumerate(self.paths)}
+        self._folded = [name.lower() for name in self.names]
+        self._last: Tuple[str, List[int]] = ("", list(range(len(self.paths))))
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def path(self, position: int) -> str:
+        return self.paths[position]
+
+    def position(self, path: str) -> Optional[int]:
+        return self.positions.get(path)
+
+    def find(self, query: str, limit: int = 50) -> List[int]:
+        """Positions of the files whose name has query's characters in
+        order, best first: a match in the base name, then in the path, then
+        the tightest spread-out match, with shorter names first on ties.
+
+        A query extending the previous one only searches that one's matches.
+        """
+        query = query.lower().replace(" ", "")
+        if not query:
+            self._last = ("", list(range(len(self.paths))))
+            return self._last[1][:limit]
+        last_query, last_matches = self._last
+        candidates = last_matches if query.startswith(last_query) else range(len(self.paths))
+        pattern = re.compile(".*?".join(re.escape(char) for char in query))
+
+        scored: List[Tuple[int, int, int]] = []
+        matches: List[int] = []
+        for position in candidates:
+            name = self._folded[position]
+            match = pattern.search(name)
+            if match is None:
+                continue
+            matches.append(position)
+            if query in name[name.rfind("/") + 1:]:
+                score = 0
+            elif query in name:
+                score = 1
+            else:
+                score = 2 + match.end() - match.start()
+            scored.append((score, len(name), position))
+
+        self._last = (query, matches)
+        return [position for _, _, position in heapq.nsmallest(limit, scored)]
@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pygments.lexer import Lexer
+from pygments.lexers import get_lexer_for_filename
+from pygments.token import _TokenType
+from pygments.util import ClassNotFound
+from rich.style import Style
+from rich.syntax import PygmentsSyntaxTheme
+
+from rediff.lines import LinePool
+
+# (start, end, style) in characters of a line's text, without its prefix
+Span = Tuple[int, int, Style]
+
+class Highlighter:
+    """Syntax highlighting by pooled line, shared by every pane.
+
+    A line is lexed on its own the first time any pane shows it, and the
+    spans are reused wherever the same text appears, in any commit or file
+    of the same language. Constructs spanning lines, like block comments,
+    are only highlighted line by line.
+    """
+    def __init__(self, pool: LinePool, theme: str = "monokai") -> None:
+        self.pool = pool
+        self._theme = PygmentsSyntaxTheme(theme)
+        self._lexers: Dict[str, Lexer] = {}
+        self._lexer_names: Dict[str, Optional[str]] = {}
+        self._styles: Dict[_TokenType, Style] = {}
+        self._spans: Dict[Tuple[str, int], List[Span]] = {}
+
+    def lexer_for(self, file_name: str) -> Optional[str]:
+        """The name of the lexer for file_name, or None if there's none."""
+        if file_name not in self._lexer_names:
+            try:
+                lexer = get_lexer_for_filename(file_name, stripnl=False, ensurenl=False)
+            except ClassNotFound:
+                self._lexer_names[file_name] = None
+            else:
+                self._lexers.setdefault(lexer.name, lexer)
+                self._lexer_names[file_name] = lexer.name
+        return self._lexer_names[file_name]
+
+    def spans(self, lexer_name: str, line_id: int) -> List[Span]:
+        key = (lexer_name, line_id)
+        spans = self._spans.get(key)
+        if spans is None:
+            spans = self._spans[key] = self._lex(self._lexers[lexer_name], self.pool.lines[line_id])
+        return spans
+
+    def prepare(self, lexer_name: str, line_ids: Iterable[int]) -> None:
+        """Lexes the lines ahead of time, e.g. just outside the view."""
+        for line_id in line_ids:
+            self.spans(lexer_name, line_id)
+
+    def _lex(self, lexer: Lexer, text: str) -> List[Span]:
+        spans: List[Span] = []
+        offset = 0
+        for token_type, value in lexer.get_tokens(text):
+            end = offset + len(value)
+            style = self._styles.get(token_type)
+            if style is None:
+                # Drop the theme's background so the diff's still shows
+                theme_style = self._theme.get_style_for_token(token_type)
+                style = self._styles[token_type] = Style(
+                    color=theme_style.color, bold=theme_style.bold,
+                    italic=theme_style.italic, underline=theme_style.underline)
+            if style and value.strip():
+                spans.append((offset, end, style))
+            offset = end
+        return spans
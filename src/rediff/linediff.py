@@ -0,0 +1,341 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from rediff.lines import LinePool, PooledLines
+
+ALGORITHMS = ("myers", "patience", "histogram")
+
+CONTEXT = ord(' ')
+ADD = ord('+')
+DELETE = ord('-')
+
+# Lines occurring more often than this in the old side aren't used to split
+# a histogram diff, as in git's xhistogram
+MAX_CHAIN = 64
+
+# (start in a, start in b, length) of a run of equal lines
+Block = Tuple[int, int, int]
+# [a_lo, a_hi) and [b_lo, b_hi) ranges still to be diffed
+_Range = Tuple[int, int, int, int]
+
+def diff_blobs(pool: LinePool, old: bytes, new: bytes, algorithm: str = "myers") -> PooledLines:
+    """Full-context diff of two blobs' text, with lines interned into pool.
+
+    The lines both start or end with are found by comparing bytes, so only
+    the lines in between are split out of both sides and diffed; the rest
+    are interned once, as context.
+    """
+    prefix = _common_prefix(old, new, 0, 0, min(len(old), len(new)))
+    prefix = old.rfind(b'\n', 0, prefix) + 1
+    old_rest, new_rest = old[prefix:], new[prefix:]
+    suffix = _common_suffix(old_rest, new_rest, len(old_rest), len(new_rest),
+                            min(len(old_rest), len(new_rest)))
+    if suffix and not all(len(rest) == suffix or rest[-suffix - 1] == ord('\n')
+                          for rest in (old_rest, new_rest)):
+        # Move the suffix up to the next line start, which both sides share
+        newline = old_rest.find(b'\n', len(old_rest) - suffix)
+        suffix = len(old_rest) - newline - 1 if newline >= 0 else 0
+
+    ids = pool.intern_all(_decode_lines(old[:prefix]))
+    kinds = bytearray([CONTEXT]) * len(ids)
+    middle_ids, middle_kinds = diff_ids(
+        pool.intern_all(_decode_lines(old_rest[:len(old_rest) - suffix])),
+        pool.intern_all(_decode_lines(new_rest[:len(new_rest) - suffix])), algorithm)
+    ids.extend(middle_ids)
+    kinds.extend(middle_kinds)
+    suffix_ids = pool.intern_all(_decode_lines(old_rest[len(old_rest) - suffix:]))
+    ids.extend(suffix_ids)
+    kinds.extend(bytes([CONTEXT]) * len(suffix_ids))
+    return PooledLines(pool, ids, bytes(kinds))
+
+def diff_ids(a: Sequence[int], b: Sequence[int], algorithm: str = "myers") -> Tuple[array, bytes]:
+    """Full-context diff of two files given as line ids, as the ids and
+    ' '/'+'/'-' kind bytes of PooledLines.
+
+    Like git, the deleted lines of each change come before the added ones.
+    """
+    ids = array('I')
+    kinds = bytearray()
+    i = j = 0
+    for block_i, block_j, length in matching_blocks(a, b, algorithm) + [(len(a), len(b), 0)]:
+        ids.extend(a[i:block_i])
+        kinds.extend(bytes([DELETE]) * (block_i - i))
+        ids.extend(b[j:block_j])
+        kinds.extend(bytes([ADD]) * (block_j - j))
+        ids.extend(a[block_i:block_i + length])
+        kinds.extend(bytes([CONTEXT]) * length)
+        i = block_i + length
+        j = block_j + length
+    return ids, bytes(kinds)
+
+def matching_blocks(a: Sequence[int], b: Sequence[int], algorithm: str = "myers") -> List[Block]:
+    """Sorted runs of lines a and b have in common.
+
+    Lines only one side has can never match, so they are dropped before the
+    algorithm runs, as git does. A rewritten region then costs nothing to
+    diff rather than the square of its size.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown diff algorithm: {algorithm}")
+    common = set(a).intersection(b)
+    a_index = [i for i, line in enumerate(a) if line in common]
+    b_index = [j for j, line in enumerate(b) if line in common]
+    a_kept = [a[i] for i in a_index]
+    b_kept = [b[j] for j in b_index]
+
+    pairs: List[Tuple[int, int]] = []
+    if algorithm == "myers":
+        _myers(a_kept, b_kept, (0, len(a_kept), 0, len(b_kept)), pairs)
+    elif algorithm == "patience":
+        _patience(a_kept, b_kept, pairs)
+    else:
+        _histogram(a_kept, b_kept, pairs)
+    pairs.sort()
+
+    blocks: List[Block] = []
+    for kept_i, kept_j in pairs:
+        i, j = a_index[kept_i], b_index[kept_j]
+        if blocks:
+            last_i, last_j, length = blocks[-1]
+            if last_i + length == i and last_j + length == j:
+                blocks[-1] = (last_i, last_j, length + 1)
+                continue
+        blocks.append((i, j, 1))
+    return blocks
+
+def _trim(a: Sequence[int], b: Sequence[int], diff_range: _Range,
+          pairs: List[Tuple[int, int]]) -> _Range:
+    """Matches the common prefix and suffix of a range, returning what's left."""
+    a_lo, a_hi, b_lo, b_hi = diff_range
+    prefix = _common_prefix(a, b, a_lo, b_lo, min(a_hi - a_lo, b_hi - b_lo))
+    pairs.extend(zip(range(a_lo, a_lo + prefix), range(b_lo, b_lo + prefix)))
+    a_lo += prefix
+    b_lo += prefix
+    suffix = _common_suffix(a, b, a_hi, b_hi, min(a_hi - a_lo, b_hi - b_lo))
+    pairs.extend(zip(range(a_hi - suffix, a_hi), range(b_hi - suffix, b_hi)))
+    return a_lo, a_hi - suffix, b_lo, b_hi - suffix
+
+def _myers(a: Sequence[int], b: Sequence[int], diff_range: _Range,
+           pairs: List[Tuple[int, int]]) -> None:
+    """Myers' O(ND) diff in linear space: each range is split where the
+    forward and reverse searches for its shortest edit script meet."""
+    todo = [diff_range]
+    while todo:
+        a_lo, a_hi, b_lo, b_hi = _trim(a, b, todo.pop(), pairs)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        split = _middle(a, b, a_lo, a_hi, b_lo, b_hi)
+        if split is None:
+            continue
+        x, y = split
+        todo.append((a_lo, a_lo + x, b_lo, b_lo + y))
+        todo.append((a_lo + x, a_hi, b_lo + y, b_hi))
+
+def _middle(a: Sequence[int], b: Sequence[int],
+            a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> Optional[Tuple[int, int]]:
+    """Where the middle snake of a[a_lo:a_hi] and b[b_lo:b_hi] starts,
+    relative to the range, or None if they have nothing in common."""
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    forward = [-1] * (2 * max_d + 2)
+    reverse = [-1] * (2 * max_d + 2)
+    forward[offset + 1] = 0
+    reverse[offset + 1] = 0
+    delta = n - m
+    odd = delta % 2 != 0
+    # Diagonals that ran off the edit graph, trimmed from both ends
+    f_start = f_end = r_start = r_end = 0
+
+    for d in range(max_d):
+        for k in range(-d + f_start, d + 1 - f_end, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if x > n:
+                f_end += 2
+            elif y > m:
+                f_start += 2
+            elif odd:
+                r_k = offset + delta - k
+                if 0 <= r_k < len(reverse) and reverse[r_k] != -1 and x >= n - reverse[r_k]:
+                    return x, y
+
+        for k in range(-d + r_start, d + 1 - r_end, 2):
+            if k == -d or (k != d and reverse[offset + k - 1] < reverse[offset + k + 1]):
+                x = reverse[offset + k + 1]
+            else:
+                x = reverse[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            reverse[offset + k] = x
+            if x > n:
+                r_end += 2
+            elif y > m:
+                r_start += 2
+            elif not odd:
+                f_k = offset + delta - k
+                if 0 <= f_k < len(forward) and forward[f_k] != -1:
+                    f_x = forward[f_k]
+                    if f_x >= n - x:
+                        return f_x, f_x - (f_k - offset)
+    return None
+
+def _patience(a: Sequence[int], b: Sequence[int], pairs: List[Tuple[int, int]]) -> None:
+    """Patience diff: lines unique to both sides of a range are matched up
+    along their longest common subsequence, and the gaps between them
+    diffed the same way. Ranges without unique lines fall back to Myers."""
+    todo = [(0, len(a), 0, len(b))]
+    while todo:
+        a_lo, a_hi, b_lo, b_hi = diff_range = _trim(a, b, todo.pop(), pairs)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = _unique_common(a, b, diff_range)
+        if not anchors:
+            _myers(a, b, diff_range, pairs)
+            continue
+        for i, j in anchors:
+            pairs.append((i, j))
+            todo.append((a_lo, i, b_lo, j))
+            a_lo, b_lo = i + 1, j + 1
+        todo.append((a_lo, a_hi, b_lo, b_hi))
+
+def _unique_common(a: Sequence[int], b: Sequence[int], diff_range: _Range) -> List[Tuple[int, int]]:
+    """The longest increasing run of (i, j) pairs of lines that occur once
+    in each side of the range."""
+    a_lo, a_hi, b_lo, b_hi = diff_range
+    a_unique: Dict[int, int] = {}
+    for i in range(a_lo, a_hi):
+        a_unique[a[i]] = -1 if a[i] in a_unique else i
+    b_unique: Dict[int, int] = {}
+    for j in range(b_lo, b_hi):
+        b_unique[b[j]] = -1 if b[j] in b_unique else j
+    common = [(i, b_unique[line]) for line, i in a_unique.items()
+              if i >= 0 and b_unique.get(line, -1) >= 0]
+    common.sort()
+
+    # Patience sorting: piles keep the smallest j ending a run of each length
+    tops: List[int] = []
+    top_pairs: List[int] = []
+    previous: List[int] = []
+    for index, (_, j) in enumerate(common):
+        pile = bisect_left(tops, j)
+        if pile == len(tops):
+            tops.append(j)
+            top_pairs.append(index)
+        else:
+            tops[pile] = j
+            top_pairs[pile] = index
+        previous.append(top_pairs[pile - 1] if pile else -1)
+
+    run = []
+    index = top_pairs[-1] if top_pairs else -1
+    while index >= 0:
+        run.append(common[index])
+        index = previous[index]
+    return run[::-1]
+
+def _histogram(a: Sequence[int], b: Sequence[int], pairs: List[Tuple[int, int]]) -> None:
+    """Histogram diff, after git's: each range is split around the common
+    region whose rarest line occurs least often in a, preferring longer
+    regions, and the sides diffed the same way. Ranges where every line is
+    too common fall back to Myers."""
+    todo = [(0, len(a), 0, len(b))]
+    while todo:
+        a_lo, a_hi, b_lo, b_hi = diff_range = _trim(a, b, todo.pop(), pairs)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        region = _rarest_region(a, b, diff_range)
+        if region is None:
+            _myers(a, b, diff_range, pairs)
+            continue
+        start_i, end_i, start_j = region
+        for offset in range(end_i - start_i):
+            pairs.append((start_i + offset, start_j + offset))
+        todo.append((a_lo, start_i, b_lo, start_j))
+        todo.append((end_i, a_hi, start_j + end_i - start_i, b_hi))
+
+def _rarest_region(a: Sequence[int], b: Sequence[int],
+                   diff_range: _Range) -> Optional[Tuple[int, int, int]]:
+    """(start in a, end in a, start in b) of the region to split on."""
+    a_lo, a_hi, b_lo, b_hi = diff_range
+    occurrences: Dict[int, List[int]] = {}
+    for i in range(a_lo, a_hi):
+        occurrences.setdefault(a[i], []).append(i)
+
+    best = None
+    best_count = MAX_CHAIN + 1
+    best_length = 0
+    j = b_lo
+    while j < b_hi:
+        positions = occurrences.get(b[j])
+        next_j = j + 1
+        if positions is None or len(positions) > best_count:
+            j = next_j
+            continue
+        for i in positions:
+            start_i, start_j = i, j
+            count = len(positions)
+            while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                start_i -= 1
+                start_j -= 1
+                count = min(count, len(occurrences[a[start_i]]))
+            end_i, end_j = i + 1, j + 1
+            while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                count = min(count, len(occurrences[a[end_i]]))
+                end_i += 1
+                end_j += 1
+            next_j = max(next_j, end_j)
+            if end_i - start_i > best_length or count < best_count:
+                best = (start_i, end_i, start_j)
+                best_count = count
+                best_length = end_i - start_i
+        j = next_j
+    return best
+
+def _common_prefix(a: Sequence, b: Sequence, a_lo: int, b_lo: int, limit: int) -> int:
+    """How many items a[a_lo:] and b[b_lo:] start with in common, up to limit.
+
+    Slices are compared rather than items, growing while they match and
+    shrinking when they don't, so long runs are matched at C speed.
+    """
+    length = 0
+    size = 1
+    while length < limit:
+        size = min(size, limit - length)
+        if a[a_lo + length:a_lo + length + size] == b[b_lo + length:b_lo + length + size]:
+            length += size
+            size *= 2
+        elif size == 1:
+            break
+        else:
+            size //= 2
+    return length
+
+def _common_suffix(a: Sequence, b: Sequence, a_hi: int, b_hi: int, limit: int) -> int:
+    """How many items a[:a_hi] and b[:b_hi] end with in common, up to limit."""
+    length = 0
+    size = 1
+    while length < limit:
+        size = min(size, limit - length)
+        if a[a_hi - length - size:a_hi - length] == b[b_hi - length - size:b_hi - length]:
+            length += size
+            size *= 2
+        elif size == 1:
+            break
+        else:
+            size //= 2
+    return length
+
+def _decode_lines(data: bytes) -> List[str]:
+    return data.decode('utf-8', errors='replace').splitlines()
@@ -0,0 +1,149 @@
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union, overload
+
+PLACEHOLDER = ord('x')
+CONTEXT = ord(' ')
+DELETE = ord('-')
+
+class LinePool:
+    """Interned line text shared by every FileCommit of a GitData.
+
+    A line appearing in many commits, or as context, add and delete, is
+    stored once and referred to by its integer id.
+    """
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {"": 0}
+        self.lines: List[str] = [""]
+        # Rough size of the interned text, which is kept for good
+        self.nbytes = 0
+        self._lock = threading.Lock()
+
+    def intern(self, line: str) -> int:
+        line_id = self._ids.get(line)
+        if line_id is None:
+            with self._lock:
+                line_id = self._ids.get(line)
+                if line_id is None:
+                    line_id = len(self.lines)
+                    self.lines.append(line)
+                    self._ids[line] = line_id
+                    self.nbytes += sys.getsizeof(line)
+        return line_id
+
+    def intern_all(self, lines: List[str]) -> array:
+        """Ids of lines, interning the new ones in bulk under one lock."""
+        new_lines = set(lines).difference(self._ids)
+        if new_lines:
+            with self._lock:
+                added = list(new_lines.difference(self._ids))
+                start = len(self.lines)
+                # Lines go in before their ids, which intern() reads unlocked
+                self.lines.extend(added)
+                self._ids.update(zip(added, range(start, start + len(added))))
+                self.nbytes += sum(map(sys.getsizeof, added))
+        return array('I', map(self._ids.__getitem__, lines))
+
+    def encode(self, diff_lines: Iterable[str]) -> "PooledLines":
+        """Interns diff lines, splitting off their ' '/'+'/'-' prefix."""
+        ids = array('I')
+        kinds = bytearray()
+        for line in diff_lines:
+            ids.append(self.intern(line[1:]))
+            kinds.append(ord(line[0]) if line else PLACEHOLDER)
+        return PooledLines(self, ids, bytes(kinds))
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+class PooledLines(Sequence[str]):
+    """A read-only list of prefixed lines stored as pool ids and prefix bytes.
+
+    Slicing and padding copy the compact arrays, never line text; the strings
+    are only built when an item is read.
+    """
+    def __init__(self, pool: LinePool, ids: array, kinds: bytes):
+        self.pool = pool
+        self.ids = ids
+        self.kinds = kinds
+
+    @classmethod
+    def empty(cls, pool: LinePool) -> "PooledLines":
+        return cls(pool, array('I'), b'')
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+    @overload
+    def __getitem__(self, index: slice) -> "PooledLines": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, "PooledLines"]:
+        if isinstance(index, slice):
+            return PooledLines(self.pool, self.ids[index], self.kinds[index])
+        return chr(self.kinds[index]) + self.pool.lines[self.ids[index]]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[str]:
+        lines = self.pool.lines
+        for kind, line_id in zip(self.kinds, self.ids):
+            yield chr(kind) + lines[line_id]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, PooledLines):
+            return list(self) == list(other)
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"PooledLines({list(self)!r})"
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.itemsize * len(self.ids) + len(self.kinds)
+
+def pad(lines: PooledLines, hidden: Sequence[Tuple[int, int]], total_length: int) -> PooledLines:
+    """Inserts placeholder rows at the sorted, possibly overlapping, `hidden`
+    row ranges and pads the result out to total_length rows."""
+    ids = array('I')
+    kinds = bytearray()
+    pointer = 0
+    for line_start, line_end in hidden:
+        if line_start > len(ids):
+            next_pointer = pointer + line_start - len(ids)
+            ids.extend(lines.ids[pointer:next_pointer])
+            kinds.extend(lines.kinds[pointer:next_pointer])
+            pointer = next_pointer
+        if line_end > len(ids):
+            count = line_end - len(ids)
+            ids.extend(array('I', [0]) * count)
+            kinds.extend(bytes([PLACEHOLDER]) * count)
+    ids.extend(lines.ids[pointer:])
+    kinds.extend(lines.kinds[pointer:])
+    if len(ids) < total_length:
+        count = total_length - len(ids)
+        ids.extend(array('I', [0]) * count)
+        kinds.extend(bytes([PLACEHOLDER]) * count)
+    return PooledLines(lines.pool, ids, bytes(kinds))
+
+def post_image(lines: PooledLines) -> PooledLines:
+    """The file a diff leaves behind, as context lines."""
+    ids = array('I', (line_id for kind, line_id in zip(lines.kinds, lines.ids) if kind != DELETE))
+    return PooledLines(lines.pool, ids, bytes([CONTEXT]) * len(ids))
+
+def split_diff_line(line: str, newline: bool = True) -> List[str]:
+    """Splits one line of git's patch output the way str.splitlines() splits
+    file content, so every loader gives a file the same rows: a '\r' before
+    the newline is dropped, and other breaks such as '\x0c' start new lines
+    with the same prefix. `newline` is False for a last line git marked
+    "\\ No newline at end of file"."""
+    prefix, content = line[:1], line[1:]
+    if newline:
+        content += "\n"
+    return [prefix + part for part in content.splitlines()] or [prefix]
@@ -0,0 +1,263 @@
+import subprocess
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from rediff.lines import split_diff_line
+
+# Markers around the commit header in `git log --format`, chosen because
+# they can't start a diff line.
+COMMIT_START = "\x1e"
+MESSAGE_END = "\x1f"
+LOG_FORMAT = "format:%x1e%H %P%n%B%x1f"
+
+class FileChange:
+    """One file changed by a commit, with the parts of git.diff.Diff that
+    GitData uses."""
+    def __init__(self, a_path: Optional[str], b_path: Optional[str], change_type: str,
+                 a_blob_sha: Optional[str] = None, b_blob_sha: Optional[str] = None,
+                 binary: bool = False, truncated: bool = False):
+        self.a_path = a_path
+        self.b_path = b_path
+        self.change_type = change_type
+        # Blob shas from the "index" line, all zeros for a missing side. None
+        # when git doesn't print one, e.g. for a rename with no content change.
+        self.a_blob_sha = a_blob_sha
+        self.b_blob_sha = b_blob_sha
+        # No diff lines were kept: git reported a binary file, or the diff
+        # went over iter_log's max_file_size
+        self.binary = binary
+        self.truncated = truncated
+
+    @property
+    def new_file(self) -> bool:
+        return self.change_type == "A"
+
+    @property
+    def deleted_file(self) -> bool:
+        return self.change_type == "D"
+
+    @property
+    def renamed_file(self) -> bool:
+        return self.change_type == "R"
+
+    def __repr__(self) -> str:
+        return f"FileChange({self.change_type}: {self.a_path} -> {self.b_path})"
+
+class LogCommit:
+    def __init__(self, hexsha: str, parents: List[str], message: str):
+        self.hexsha = hexsha
+        self.parents = parents
+        self.message = message
+        self.changed_files: List[FileChange] = []
+        # {path: (parent path, diff lines)}, as stored by DiffCache. Lines are
+        # None for binary and truncated files.
+        self.file_diffs: Dict[str, Tuple[str, Optional[List[str]]]] = {}
+
+class _FileDiffParser:
+    def __init__(self, header: str, max_size: Optional[int] = None):
+        self.header = header
+        self.max_size = max_size
+        self.size = 0
+        self.binary = False
+        self.truncated = False
+        self.a_path: Optional[str] = None
+        self.b_path: Optional[str] = None
+        self.change_type = "M"
+        self.a_blob_sha: Optional[str] = None
+        self.b_blob_sha: Optional[str] = None
+        self.lines: List[str] = []
+        # The last diff line fed, and how many lines it was split into
+        self._last: Tuple[str, int] = ("", 0)
+        self.in_hunk = False
+
+    def feed(self, line: str) -> None:
+        if self.in_hunk:
+            if self.truncated:
+                return
+            if line.startswith(("+", "-", " ")):
+                split = split_diff_line(line)
+                self.lines.extend(split)
+                self._last = (line, len(split))
+                self.size += len(line)
+                if self.max_size and self.size > self.max_size:
+                    self.truncate()
+            elif line.startswith("\\") and self._last[1]:
+                # "\ No newline at end of file": split the last line again
+                last_line, count = self._last
+                del self.lines[-count:]
+                self.lines.extend(split_diff_line(last_line, newline=False))
+                self._last = ("", 0)
+            return
+
+        if line.startswith("@@"):
+            self.in_hunk = True
+        elif line.startswith("new file mode"):
+            self.change_type = "A"
+        elif line.startswith("deleted file mode"):
+            self.change_type = "D"
+        elif line.startswith("Binary files "):
+            self.binary = True
+        elif line.startswith("index "):
+            self.a_blob_sha, _, self.b_blob_sha = line[len("index "):].split(" ")[0].partition("..")
+        elif line.startswith("rename from "):
+            self.change_type = "R"
+            self.a_path = _unquote(line[len("rename from "):])
+        elif line.startswith("rename to "):
+            self.b_path = _unquote(line[len("rename to "):])
+        elif line.startswith("--- "):
+            self.a_path = _strip_prefix(line[4:], "a/") or self.a_path
+        elif line.startswith("+++ "):
+            self.b_path = _strip_prefix(line[4:], "b/") or self.b_path
+
+    def truncate(self) -> None:
+        self.truncated = True
+        self.lines = []
+
+    def finish(self) -> FileChange:
+        a_path, b_path = self.a_path, self.b_path
+        if a_path is None and b_path is None:
+            # No ---/+++ lines (binary or mode-only change): both sides of the
+            # "diff --git a/<path> b/<path>" header name the same file
+            paths = self.header[len("diff --git "):]
+            path = _unquote(paths[:(len(paths) - 1) // 2])[2:]
+            a_path = b_path = path
+        if self.change_type == "A":
+            a_path = b_path
+        elif self.change_type == "D":
+            b_path = a_path
+        return FileChange(a_path or b_path, b_path or a_path, self.change_type,
+                          self.a_blob_sha, self.b_blob_sha, self.binary, self.truncated)
+
+def iter_log(repo_path: str, rev_range: str, unified: int = 999999,
+             max_file_size: Optional[int] = None) -> Iterator[LogCommit]:
+    """Streams the commits of rev_range, oldest first, with their full-context
+    diffs, from a single `git log -p` process.
+
+    Diff lines of a file are dropped once they add up to more than
+    max_file_size, and output is read in chunks of at most that size, so
+    one huge file can't take the whole diff into memory.
+    """
+    cmd = [
+        "git", "-C", repo_path, "-c", "core.quotepath=off",
+        "log", "--reverse", "-p", "--full-index", "-M", "--no-ext-diff",
+        "--no-color", f"--unified={unified}", f"--format={LOG_FORMAT}",
+        rev_range, "--",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    stdout = proc.stdout
+
+    commit: Optional[LogCommit] = None
+    file_diff: Optional[_FileDiffParser] = None
+    message: Optional[List[str]] = None
+    chunk_size = max_file_size + 1 if max_file_size else -1
+    partial = False
+
+    def finish_file_diff() -> None:
+        if file_diff is not None:
+            assert commit is not None
+            change = file_diff.finish()
+            commit.changed_files.append(change)
+            assert change.a_path is not None and change.b_path is not None
+            path = change.a_path if change.deleted_file else change.b_path
+            lines = None if change.binary or change.truncated else file_diff.lines
+            commit.file_diffs[path] = (change.a_path, lines)
+
+    try:
+        for raw_line in iter(lambda: stdout.readline(chunk_size), b""):
+            # The rest of a line longer than a chunk
+            continued, partial = partial, not raw_line.endswith(b"\n")
+            if continued and file_diff is not None and message is None:
+                file_diff.truncate()
+                continue
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+
+            if message is not None:
+                # %B has no trailing newline if the message didn't
+                if line.endswith(MESSAGE_END):
+                    assert commit is not None
+                    message.append(line[:-1])
+                    commit.message = "\n".join(message).rstrip("\n")
+                    message = None
+                else:
+                    message.append(line)
+            elif line.startswith(COMMIT_START):
+                finish_file_diff()
+                file_diff = None
+                if commit is not None:
+                    yield commit
+                hexsha, *parents = line[1:].split()
+                commit = LogCommit(hexsha, parents, "")
+                message = []
+            elif line.startswith("diff --git "):
+                finish_file_diff()
+                file_diff = _FileDiffParser(line, max_file_size)
+            elif file_diff is not None and line:
+                file_diff.feed(line)
+
+        finish_file_diff()
+        if commit is not None:
+            yield commit
+    finally:
+        stdout.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        raise Exception(f"git log failed for {rev_range} ({returncode})")
+
+class BlobReader:
+    """Reads objects over one long-lived `git cat-file --batch` process,
+    rather than starting git for every blob."""
+    def __init__(self, repo_path: str):
+        self._proc = subprocess.Popen(
+            ["git", "-C", repo_path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._lock = threading.Lock()
+
+    def read(self, sha: str) -> Optional[bytes]:
+        """The object's content, or None if the repo doesn't have it."""
+        assert self._proc.stdin is not None and self._proc.stdout is not None
+        with self._lock:
+            self._proc.stdin.write(f"{sha}\n".encode())
+            self._proc.stdin.flush()
+            header = self._proc.stdout.readline()
+            if not header:
+                raise Exception(f"git cat-file exited ({self._proc.poll()})")
+            if header.endswith(b" missing\n"):
+                return None
+            size = int(header.split()[2])
+            data = self._proc.stdout.read(size)
+            self._proc.stdout.read(1)
+            return data
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            assert self._proc.stdin is not None
+            self._proc.stdin.close()
+            self._proc.wait()
+            if self._proc.stdout:
+                self._proc.stdout.close()
+
+def _strip_prefix(path: str, prefix: str) -> Optional[str]:
+    path = _unquote(path.rstrip("\t"))
+    if path == "/dev/null":
+        return None
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+def _unquote(path: str) -> str:
+    """Undoes git's C-style quoting of unusual path names."""
+    if not (path.startswith('"') and path.endswith('"')):
+        return path
+    escapes = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13}
+    raw = bytearray()
+    chars = iter(path[1:-1])
+    for char in chars:
+        if char != "\\":
+            raw += char.encode("utf-8")
+            continue
+        char = next(chars, "")
+        if char in "01234567" and char:
+            raw.append(int(char + next(chars, "") + next(chars, ""), 8))
+        else:
+            raw.append(escapes.get(char, ord(char or "\\")))
+    return raw.decode("utf-8", errors="replace")
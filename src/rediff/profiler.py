@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple, Union
+
+class Span:
+    def __init__(self, name: str, start: float, end: float, thread_id: int,
+                 args: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.thread_id = thread_id
+        self.args = args
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+class Profiler:
+    """Timed spans of rediff's work, for --profile.
+
+    Spans carry "file" and "commit" args where they apply, so the table can
+    pin slow phases on a file or commit. They can be recorded from any thread.
+    """
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            with self._lock:
+                self._thread_names.setdefault(thread.ident or 0, thread.name)
+                self.spans.append(Span(name, start, end, thread.ident or 0, args))
+
+    def write_trace(self, path: str) -> None:
+        """Writes the spans in Chrome trace event format, for chrome://tracing
+        or Perfetto."""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._thread_names.items()
+        ]
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {key: str(value) for key, value in span.args.items()},
+            })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def totals(self, key: str) -> "OrderedDict[str, Dict[str, float]]":
+        """Total seconds per span name for each value of the `key` arg,
+        slowest first."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            value = span.args.get(key)
+            if value is None:
+                continue
+            phases = totals.setdefault(str(value), {})
+            phases[span.name] = phases.get(span.name, 0.0) + span.duration
+        return OrderedDict(sorted(totals.items(), key=lambda item: -sum(item[1].values())))
+
+    def table(self, limit: Optional[int] = 20) -> str:
+        """Per-phase totals, then the slowest files and commits by phase.
+
+        Phases nest: a commit's tree diff runs inside the first load that
+        needs it, and is counted in both.
+        """
+        phases: Dict[str, Tuple[int, float]] = {}
+        for span in self.spans:
+            calls, total = phases.get(span.name, (0, 0.0))
+            phases[span.name] = (calls + 1, total + span.duration)
+
+        lines = [f"{'phase':30} {'calls':>8} {'total ms':>10}"]
+        for name, (calls, total) in sorted(phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:30} {calls:8} {total * 1000:10.1f}")
+
+        for key in ("file", "commit"):
+            totals = self.totals(key)
+            if not totals:
+                continue
+            names = sorted({name for phases_ in totals.values() for name in phases_})
+            lines.append("")
+            lines.append(f"{key:40} " + " ".join(f"{name:>12}" for name in names)
+                         + f" {'total ms':>10}")
+            for value, phases_ in list(totals.items())[:limit]:
+                cells = " ".join(f"{phases_.get(name, 0.0) * 1000:12.1f}" for name in names)
+                lines.append(f"{value[-40:]:40} {cells} {sum(phases_.values()) * 1000:10.1f}")
+        return "\n".join(lines)
+
+class NullProfiler:
+    """Stands in for a Profiler when --profile is off."""
+    def span(self, name: str, **args: Any) -> ContextManager[None]:
+        return nullcontext()
+
+AnyProfiler = Union[Profiler, NullProfiler]
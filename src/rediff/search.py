@@ -0,0 +1,90 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from rediff.lines import PLACEHOLDER, PooledLines
+
+ADD = ord('+')
+DELETE = ord('-')
+
+class SearchMatch:
+    """A row where some commit's line contains the query, and the commits
+    that add or delete a matching line there."""
+    def __init__(self, row: int, number: int, count: int,
+                 added: List[str], deleted: List[str]):
+        self.row = row
+        self.number = number
+        self.count = count
+        self.added = added
+        self.deleted = deleted
+
+class SearchIndex:
+    """Case-insensitive substring search over the padded lines of every
+    commit of a file.
+
+    Each distinct pooled line is indexed once, by its trigrams, along with
+    the rows it appears on in any commit. A query checks only the lines
+    sharing all its trigrams, then maps them to rows.
+    """
+    def __init__(self, columns: Mapping[str, PooledLines]):
+        self.columns = columns
+        self._rows: Dict[int, List[int]] = {}
+        for row, line_ids in enumerate(zip(*(lines.ids for lines in columns.values()))):
+            for line_id, lines in zip(line_ids, columns.values()):
+                if lines.kinds[row] == PLACEHOLDER:
+                    continue
+                rows = self._rows.setdefault(line_id, [])
+                if not rows or rows[-1] != row:
+                    rows.append(row)
+
+        pool_lines = next(iter(columns.values())).pool.lines if columns else []
+        self._text = {line_id: pool_lines[line_id].lower() for line_id in self._rows}
+        self._trigrams: Dict[str, Set[int]] = {}
+        for line_id, text in self._text.items():
+            for i in range(len(text) - 2):
+                self._trigrams.setdefault(text[i:i + 3], set()).add(line_id)
+        self._last: Tuple[str, Set[int], List[int]] = ("", set(), [])
+
+    def find(self, query: str) -> List[int]:
+        """Sorted rows where any commit has a line containing query."""
+        return self._lookup(query)[1]
+
+    def next_match(self, query: str, row: int, backwards: bool = False) -> Optional[SearchMatch]:
+        """The first match after row, or before it going backwards, wrapping
+        around the file."""
+        line_ids, rows = self._lookup(query)
+        if not rows:
+            return None
+        if backwards:
+            number = bisect_left(rows, row) - 1
+        else:
+            number = bisect_right(rows, row) % len(rows)
+        match_row = rows[number]
+
+        added = []
+        deleted = []
+        for sha, lines in self.columns.items():
+            if lines.ids[match_row] in line_ids:
+                if lines.kinds[match_row] == ADD:
+                    added.append(sha)
+                elif lines.kinds[match_row] == DELETE:
+                    deleted.append(sha)
+        return SearchMatch(match_row, number % len(rows), len(rows), added, deleted)
+
+    def _lookup(self, query: str) -> Tuple[Set[int], List[int]]:
+        query = query.lower()
+        if query == self._last[0]:
+            return self._last[1], self._last[2]
+        if not query:
+            return set(), []
+
+        candidates: Iterable[int]
+        if len(query) < 3:
+            candidates = self._text.keys()
+        else:
+            postings = [self._trigrams.get(query[i:i + 3], set()) for i in range(len(query) - 2)]
+            postings.sort(key=len)
+            candidates = set.intersection(*postings)
+        line_ids = {line_id for line_id in candidates if query in self._text[line_id]}
+        rows = sorted({row for line_id in line_ids for row in self._rows[line_id]})
+        self._last = (query, line_ids, rows)
+        return line_ids, rows
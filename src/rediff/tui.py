@@ -0,0 +1,619 @@
+from collections import OrderedDict
+from typing import List, Optional
+
+from rich.text import Text
+from textual import events, work
+from textual.app import App, ComposeResult
+from textual.containers import Center, HorizontalScroll, Middle, Vertical
+from textual.message import Message
+from textual.screen import ModalScreen, Screen
+from textual.widget import Widget
+from textual.widgets import Input, Label, OptionList, ProgressBar, Static
+from textual.widgets.option_list import Option
+from textual.worker import get_current_worker
+
+from rediff.db import DEFAULT_MAX_FILE_SIZE, GitData, FileHistory, FileCommit
+from rediff.fileindex import FileIndex
+from rediff.filediffview import FileDiffView, Cmd
+from rediff.highlight import Highlighter
+from rediff.profiler import Profiler
+from rediff.search import SearchMatch
+from rediff.viewport import ViewportModel
+
+class SingleFileAllCommits(HorizontalScroll):
+    """All commits of one file side by side.
+
+    Only the panes in view, plus BUFFER_PANES on each side, are mounted.
+    Spacers stand in for the rest so the scroll width still covers every
+    commit, and panes are handed new commits as the view moves.
+    """
+    BUFFER_PANES = 1
+
+    def __init__(self, file_history: FileHistory, curr_pane: int = 0,
+                 cursor_row: int = 0, scroll_y: int = 0,
+                 highlighter: Optional[Highlighter] = None) -> None:
+        super().__init__()
+        self.file_history = file_history
+        self.highlighter = highlighter
+        self.aligned = file_history.get_aligned()
+        self.file_commits = list(file_history.file_commits.values())
+        self.panes: List[CommitFilePane] = []
+        self._window_start = 0
+        self._curr_pane = min(curr_pane, len(self.file_commits) - 1)
+        self.viewport = ViewportModel(self.aligned.total_length)
+        last_row = max(0, self.aligned.total_length - 1)
+        self.viewport.cursor_row = min(cursor_row, last_row)
+        self.viewport.scroll_y = min(scroll_y, self.viewport.cursor_row)
+        self._pending_rows = 0
+        self._left_spacer = Static(classes="pane-spacer")
+        self._right_spacer = Static(classes="pane-spacer")
+
+    def compose(self) -> ComposeResult:
+        self.panes = [
+            CommitFilePane(file_commit, self.file_history, self.viewport, self.highlighter)
+            for file_commit in self.file_commits[:self._window_size(self.app.size.width)]
+        ]
+        yield self._left_spacer
+        yield from self.panes
+        yield self._right_spacer
+
+    def on_mount(self) -> None:
+        self._update_spacers()
+        # Views composed ahead of time stay hidden until switched to
+        if self.display:
+            self.focus_pane(self._curr_pane)
+
+    def refocus(self) -> None:
+        """Scrolls to and focuses the current pane, e.g. once shown again."""
+        self.focus_pane(self._curr_pane)
+
+    def on_resize(self, event: events.Resize) -> None:
+        window_size = self._window_size(event.size.width)
+        while len(self.panes) < window_size:
+            commit_no = self._window_start + len(self.panes)
+            if commit_no < len(self.file_commits):
+                pane = CommitFilePane(self.file_commits[commit_no], self.file_history,
+                                      self.viewport, self.highlighter)
+                self.panes.append(pane)
+                self.mount(pane, before=self._right_spacer)
+            else:
+                # The window already ends at the last commit: grow it leftwards
+                self._window_start -= 1
+                pane = CommitFilePane(self.file_commits[self._window_start], self.file_history,
+                                      self.viewport, self.highlighter)
+                self.panes.insert(0, pane)
+                self.mount(pane, after=self._left_spacer)
+        while len(self.panes) > window_size:
+            self.panes.pop().remove()
+        self._update_spacers()
+        # New panes compose their views once mounted
+        self.call_after_refresh(self._update_cursors)
+        self._move_window(self._first_visible())
+
+    def watch_scroll_x(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_x(old_value, new_value)
+        self._move_window(self._first_visible())
+
+    def _window_size(self, width: int) -> int:
+        visible = -(-width // CommitFilePane.WIDTH) + 1  # a partial pane at each edge
+        return min(len(self.file_commits), visible + 2 * self.BUFFER_PANES)
+
+    def _first_visible(self) -> int:
+        return int(self.scroll_x) // CommitFilePane.WIDTH
+
+    def _move_window(self, first_visible: int) -> None:
+        window_size = len(self.panes)
+        start = max(0, min(first_visible - self.BUFFER_PANES,
+                           len(self.file_commits) - window_size))
+        if start == self._window_start:
+            return
+
+        # Keep panes whose commit is still in the window, recycle the rest
+        old_start = self._window_start
+        kept = {old_start + i: pane for i, pane in enumerate(self.panes)
+                if start <= old_start + i < start + window_size}
+        spare = [pane for pane in self.panes if pane not in kept.values()]
+        panes = []
+        for commit_no in range(start, start + window_size):
+            pane = kept.get(commit_no)
+            if pane is None:
+                pane = spare.pop()
+                pane.show_commit(self.file_commits[commit_no])
+            panes.append(pane)
+            self.move_child(pane, before=self._right_spacer)
+
+        self.panes = panes
+        self._window_start = start
+        self._update_spacers()
+        self._update_cursors()
+
+    def _update_spacers(self) -> None:
+        hidden_right = len(self.file_commits) - self._window_start - len(self.panes)
+        self._left_spacer.styles.width = self._window_start * CommitFilePane.WIDTH
+        self._right_spacer.styles.width = hidden_right * CommitFilePane.WIDTH
+
+    def _update_cursors(self) -> None:
+        for i, commit_file_pane in enumerate(self.panes):
+            if self._window_start + i == self._curr_pane:
+                commit_file_pane.fv.show_cursor = True
+                if self.display:
+                    commit_file_pane.fv.focus()
+            else:
+                commit_file_pane.fv.show_cursor = False
+
+    def focus_pane(self, next_pane: int):
+        num_panes = len(self.file_commits)
+        next_pane = min(max(0, next_pane), num_panes-1)
+        self._curr_pane = next_pane
+
+        # Scroll just far enough to show the pane
+        pane_x = next_pane * CommitFilePane.WIDTH
+        scroll_x = int(self.scroll_x)
+        if pane_x < scroll_x:
+            scroll_x = pane_x
+        elif pane_x + CommitFilePane.WIDTH > scroll_x + self.size.width:
+            scroll_x = pane_x + CommitFilePane.WIDTH - self.size.width
+        self._move_window(scroll_x // CommitFilePane.WIDTH)
+        self.scroll_to(x=scroll_x, animate=False)
+        self._update_cursors()
+
+    def on_file_diff_view_parent_command(self, command: FileDiffView.ParentCommand) -> None:
+        if command.cmd == Cmd.FOCUS_PANE_LEFT:
+            self.focus_pane(self._curr_pane - 1)
+        elif command.cmd == Cmd.FOCUS_PANE_RIGHT:
+            self.focus_pane(self._curr_pane + 1)
+        elif command.cmd == Cmd.CURSOR_MOVE:
+            if command.data:
+                # Coalesce key repeats into one viewport update per frame
+                if not self._pending_rows:
+                    self.call_after_refresh(self._flush_cursor_move)
+                self._pending_rows += command.data["delta"][0]
+
+    def search(self, query: str, backwards: bool = False) -> Optional[SearchMatch]:
+        """Moves every pane to the next row matching query."""
+        index = self.aligned.get_search_index()
+        match = index.next_match(query, self.viewport.cursor_row, backwards)
+        if match is not None:
+            height = self.panes[0].fv.size.height if self.panes else 0
+            self.viewport.move_cursor(match.row - self.viewport.cursor_row, height)
+        return match
+
+    def _flush_cursor_move(self) -> None:
+        rows, self._pending_rows = self._pending_rows, 0
+        height = self.panes[0].fv.size.height if self.panes else 0
+        self.viewport.move_cursor(rows, height)
+
+class CommitFilePane(Vertical):
+    WIDTH = 60
+    DEFAULT_CSS = f"""
+    CommitFilePane {{
+        width: {WIDTH};
+    }}
+    """
+
+    def __init__(self, file_commit: FileCommit, file_history: FileHistory,
+                 viewport: Optional[ViewportModel] = None,
+                 highlighter: Optional[Highlighter] = None) -> None:
+        super().__init__()
+        self.file_commit = file_commit
+        self.file_history = file_history
+        self.viewport = viewport
+        self.highlighter = highlighter
+
+    def compose(self) -> ComposeResult:
+        self.commit_label = Label(self._commit_text())
+        self.file_label = Label(self.file_commit.file_name)
+        yield self.commit_label
+        yield self.file_label
+        self.fv = FileDiffView(
+                self.file_commit,
+                self.file_history.get_aligned(),
+                self.viewport,
+                self.highlighter,
+            )
+        yield self.fv
+
+    def show_commit(self, file_commit: FileCommit) -> None:
+        """Reuses this pane for another commit of the same file."""
+        self.file_commit = file_commit
+        self.commit_label.update(self._commit_text())
+        self.file_label.update(file_commit.file_name)
+        self.fv.show_commit(file_commit, self.file_history.get_aligned())
+
+    def _commit_text(self) -> str:
+        return (f"{self.file_commit.commit.short}\n"
+                f"{self.file_commit.commit.summary}")
+
+class FilePlaceholder(Static, can_focus=True):
+    """Stands in for the panes of a file that isn't shown, e.g. a binary or
+    oversized one."""
+    def __init__(self, file_history: FileHistory) -> None:
+        super().__init__(f"{file_history.file_name}\n\n{file_history.placeholder}")
+        self.file_history = file_history
+
+    def on_mount(self) -> None:
+        if self.display:
+            self.focus()
+
+    def on_key(self, event: events.Key) -> None:
+        if event.character == "K":
+            self.post_message(FileDiffView.ParentCommand(Cmd.FOCUS_FILE_PREV))
+        elif event.character == "J":
+            self.post_message(FileDiffView.ParentCommand(Cmd.FOCUS_FILE_NEXT))
+        elif event.character == "f":
+            self.post_message(FileDiffView.ParentCommand(Cmd.FIND_FILE))
+
+class SearchBar(Input):
+    """Reads a search query at the bottom of the screen."""
+    BINDINGS = [("escape", "cancel", "Cancel search")]
+
+    class Cancelled(Message):
+        pass
+
+    def action_cancel(self) -> None:
+        self.post_message(self.Cancelled())
+
+class FileFinder(ModalScreen[Optional[int]]):
+    """Fuzzy finds a file by name and returns its position."""
+    BINDINGS = [
+        ("escape", "dismiss(None)", "Cancel"),
+        ("up", "move(-1)", "Previous file"),
+        ("down", "move(1)", "Next file"),
+    ]
+    # Files listed at a time
+    LIMIT = 50
+
+    def __init__(self, file_index: FileIndex) -> None:
+        super().__init__()
+        self.file_index = file_index
+
+    def compose(self) -> ComposeResult:
+        with Vertical(id="file-finder"):
+            yield Input(placeholder=f"Find one of {len(self.file_index)} files")
+            yield OptionList()
+
+    def on_mount(self) -> None:
+        self._show_matches("")
+        self.query_one(Input).focus()
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        self._show_matches(event.value)
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        event.stop()
+        option_list = self.query_one(OptionList)
+        if option_list.highlighted is not None:
+            self._choose(option_list.get_option_at_index(option_list.highlighted))
+
+    def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
+        self._choose(event.option)
+
+    def action_move(self, rows: int) -> None:
+        option_list = self.query_one(OptionList)
+        if option_list.option_count:
+            highlighted = (option_list.highlighted or 0) + rows
+            option_list.highlighted = min(max(0, highlighted), option_list.option_count - 1)
+
+    def _show_matches(self, query: str) -> None:
+        file_index = self.file_index
+        option_list = self.query_one(OptionList)
+        option_list.clear_options()
+        option_list.add_options(
+            Option(Text.assemble(file_index.names[position], "  ",
+                                 (str(file_index.stats[position]), "dim")),
+                   id=str(position))
+            for position in file_index.find(query, self.LIMIT))
+        if option_list.option_count:
+            option_list.highlighted = 0
+
+    def _choose(self, option: Option) -> None:
+        assert option.id is not None
+        self.dismiss(int(option.id))
+
+class LoadingScreen(Screen):
+    def compose(self) -> ComposeResult:
+        with Middle():
+            with Center():
+                yield Label("Loading commits", id="loading-status")
+            with Center():
+                yield ProgressBar(show_eta=False, id="loading-progress")
+
+    def update_progress(self, stage: str, done: int, total: int) -> None:
+        if total:
+            status = f"Loading {stage}: {done}/{total}"
+        else:
+            status = f"Loading {stage}: {done}"
+        self.query_one("#loading-status", Label).update(status)
+        self.query_one("#loading-progress", ProgressBar).update(
+            total=total or None, progress=done)
+
+class Rediff(App):
+    CSS_PATH = "app.tcss"
+    # Seconds between checks for a moved HEAD or base ref
+    RELOAD_INTERVAL = 1.0
+    # Composed file views kept mounted, hidden, including the current one
+    VIEW_CACHE_SIZE = 5
+
+    class Prefetched(Message):
+        """GitData has the next or previous file ready to show."""
+        def __init__(self, file_history: FileHistory) -> None:
+            super().__init__()
+            self.file_history = file_history
+
+    def __init__(self, repo_path: str, base_ref: str, use_cache: bool = True,
+                 streaming: bool = False, jobs: int = 1,
+                 max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE,
+                 profiler: Optional[Profiler] = None, syntax: bool = False,
+                 max_memory: Optional[int] = None,
+                 diff_algorithm: Optional[str] = None) -> None:
+        super().__init__()
+        self.repo_path = repo_path
+        self.base_ref = base_ref
+        self.use_cache = use_cache
+        self.streaming = streaming
+        self.jobs = jobs
+        self.max_file_size = max_file_size
+        self.profiler = profiler
+        self.syntax = syntax
+        self.max_memory = max_memory
+        self.diff_algorithm = diff_algorithm
+        self.highlighter: Optional[Highlighter] = None
+        self.gitdata: Optional[GitData] = None
+        self._curr_file: int = 0
+        self.file_view: Optional[Widget] = None
+        self._views: OrderedDict[FileHistory, Widget] = OrderedDict()
+        self.loading_screen = LoadingScreen()
+        self.search_bar = SearchBar(placeholder="Search this file")
+        self.search_status = Label(id="search-status")
+        self.search_query = ""
+        self._search_return: Optional[Widget] = None
+
+    def on_mount(self) -> None:
+        self.push_screen(self.loading_screen)
+        self.load_git_data()
+
+    @work(thread=True, exclusive=True)
+    def load_git_data(self) -> None:
+        gitdata = GitData(
+            self.repo_path,
+            self.base_ref,
+            self.use_cache,
+            lazy=True,
+            streaming=self.streaming,
+            progress=self._report_progress,
+            jobs=self.jobs,
+            max_file_size=self.max_file_size,
+            profiler=self.profiler,
+            max_memory=self.max_memory,
+            diff_algorithm=self.diff_algorithm,
+        )
+        num_files = len(gitdata.file_histories)
+        if num_files:
+            gitdata.materialize(0)
+        self.call_from_thread(self._show_first_file, gitdata)
+
+        # Keep loading the rest behind the first file, unless memory is
+        # limited: then files load as they're viewed or prefetched
+        if self.max_memory is None:
+            gitdata.prefill_diffs()
+            worker = get_current_worker()
+            for file_no in range(1, num_files):
+                # Cancelled as the app exits, before GitData is closed
+                if worker.is_cancelled:
+                    break
+                gitdata.materialize(file_no)
+
+    def _report_progress(self, stage: str, done: int, total: int) -> None:
+        # Reloads report progress too, after the loading screen is gone
+        if self.gitdata is None:
+            self.call_from_thread(self.loading_screen.update_progress, stage, done, total)
+
+    def _show_first_file(self, gitdata: GitData) -> None:
+        self.gitdata = gitdata
+        if self.syntax:
+            self.highlighter = Highlighter(gitdata.line_pool)
+        self.pop_screen()
+        self.mount(self.search_bar, self.search_status)
+        if not gitdata.file_histories:
+            self._replace_file_view(self._no_changes())
+        else:
+            self.show_file(self._curr_file)
+        self.set_interval(self.RELOAD_INTERVAL, self.check_for_changes)
+
+    def _no_changes(self) -> Label:
+        return Label(f"No changes between {self.base_ref} and HEAD")
+
+    def _file_view(self, file_history: FileHistory, curr_pane: int = 0,
+                   cursor_row: int = 0, scroll_y: int = 0) -> Widget:
+        assert self.gitdata is not None
+        with self.gitdata.profiler.span("switch file", file=file_history.file_name):
+            if file_history.placeholder:
+                return FilePlaceholder(file_history)
+            return SingleFileAllCommits(file_history, curr_pane, cursor_row, scroll_y,
+                                        self.highlighter)
+
+    @work(thread=True, exclusive=True, group="reload")
+    def check_for_changes(self) -> None:
+        if self.gitdata and self.gitdata.refs_changed() and self.gitdata.reload():
+            self.call_from_thread(self._after_reload)
+
+    def _after_reload(self) -> None:
+        """Redraws the current file after a reload, on the same commit and
+        row where they survived."""
+        assert self.gitdata is not None
+        histories = list(self.gitdata.file_histories.values())
+        old_view = self.file_view
+        current = getattr(old_view, "file_history", None)
+        if not histories:
+            if not isinstance(old_view, Label):
+                self._replace_file_view(self._no_changes())
+            return
+
+        same_file = [i for i, fh in enumerate(histories) if fh is current]
+        self._curr_file = same_file[0] if same_file else min(self._curr_file, len(histories) - 1)
+        file_history = self.gitdata.get_file_history(self._curr_file)
+
+        if not isinstance(old_view, SingleFileAllCommits):
+            self._replace_file_view(self._file_view(file_history), file_history)
+            return
+        if (old_view.file_history is file_history and not file_history.placeholder
+                and old_view.aligned is file_history.get_aligned()):
+            # Views of the other files may be out of date
+            self._drop_views(keep=old_view)
+            return
+
+        curr_pane = old_view._curr_pane
+        if old_view.file_history is file_history:
+            # Stay on the focused commit if it survived
+            sha = old_view.file_commits[curr_pane].sha
+            shas = list(file_history.file_commits.keys())
+            curr_pane = shas.index(sha) if sha in shas else curr_pane
+        self._replace_file_view(self._file_view(
+            file_history, curr_pane, old_view.viewport.cursor_row, old_view.viewport.scroll_y),
+            file_history)
+
+    def _replace_file_view(self, file_view: Widget,
+                           file_history: Optional[FileHistory] = None) -> None:
+        """Shows file_view in place of every cached view."""
+        self._drop_views()
+        if file_history is not None:
+            self._views[file_history] = file_view
+        self.file_view = file_view
+        self.mount(file_view)
+
+    def _drop_views(self, keep: Optional[Widget] = None) -> None:
+        """Removes the current and cached views, except keep."""
+        file_views = list(self._views.values())
+        if self.file_view is not None and self.file_view not in file_views:
+            file_views.append(self.file_view)
+        self._views = OrderedDict(
+            (file_history, file_view) for file_history, file_view in self._views.items()
+            if file_view is keep)
+        for file_view in file_views:
+            if file_view is not keep:
+                file_view.remove()
+
+    def show_file(self, file_num_: int) -> None:
+        if self.gitdata is None:
+            return
+        num_files = len(self.gitdata.file_histories)
+        file_num = min(num_files-1, max(0, file_num_))
+        if file_num != file_num_:
+            return
+
+        self._curr_file = file_num
+        file_history = self.gitdata.get_file_history(file_num, self._prefetched)
+        file_view = self._cached_view(file_history)
+        if self.file_view is not None and self.file_view is not file_view:
+            self.file_view.display = False
+        self.file_view = file_view
+        file_view.display = True
+        self.call_after_refresh(self._focus_file_view, file_view)
+
+    def _focus_file_view(self, file_view: Widget) -> None:
+        if file_view is not self.file_view:
+            return
+        if isinstance(file_view, SingleFileAllCommits):
+            file_view.refocus()
+        elif file_view.can_focus:
+            file_view.focus()
+
+    def _cached_view(self, file_history: FileHistory) -> Widget:
+        """The view of a file, from the LRU of composed views or mounted
+        hidden as a new one."""
+        # Views of files evicted under the memory budget go too, along with
+        # their documents, and are rebuilt when the file is shown again
+        for evicted, old_view in list(self._views.items()):
+            if not evicted.materialized and old_view is not self.file_view:
+                del self._views[evicted]
+                old_view.remove()
+
+        file_view = self._views.get(file_history)
+        if file_view is None:
+            file_view = self._file_view(file_history)
+            file_view.display = False
+            self.mount(file_view)
+            self._views[file_history] = file_view
+        self._views.move_to_end(file_history)
+
+        while len(self._views) > self.VIEW_CACHE_SIZE:
+            oldest = next(iter(self._views))
+            if self._views[oldest] is self.file_view:
+                self._views.move_to_end(oldest)
+                continue
+            self._views.pop(oldest).remove()
+        return file_view
+
+    def _prefetched(self, file_history: FileHistory) -> None:
+        # On GitData's prefetch thread: post_message is safe to call from there
+        self.post_message(self.Prefetched(file_history))
+
+    def on_rediff_prefetched(self, message: Prefetched) -> None:
+        """Composes the view of a prefetched file, hidden, ready to switch to."""
+        file_history = message.file_history
+        assert self.gitdata is not None
+        if file_history in self._views:
+            return
+        # Skip files a reload has dropped, or the budget evicted, meanwhile
+        if file_history.materialized and any(
+                fh is file_history for fh in self.gitdata.file_histories.values()):
+            self._cached_view(file_history)
+
+    def open_search(self) -> None:
+        self._search_return = self.focused
+        self.search_status.display = False
+        self.search_bar.display = True
+        self.search_bar.value = ""
+        self.search_bar.focus()
+
+    def _close_search(self) -> None:
+        self.search_bar.display = False
+        self.search_status.display = True
+        if self._search_return is not None:
+            self._search_return.focus()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input is not self.search_bar:
+            return
+        self._close_search()
+        if event.value:
+            self.search_query = event.value
+            self.search(self.search_query)
+
+    def on_search_bar_cancelled(self, event: SearchBar.Cancelled) -> None:
+        self._close_search()
+
+    def search(self, query: str, backwards: bool = False) -> None:
+        """Jumps to the next match in the current file and reports the
+        commits that add or delete the matching line there."""
+        if not query or not isinstance(self.file_view, SingleFileAllCommits):
+            return
+        match = self.file_view.search(query, backwards)
+        if match is None:
+            self.search_status.update(f"/{query}: not found")
+            return
+        file_commits = self.file_view.aligned.file_commits
+        status = f"/{query}: {match.number + 1}/{match.count}, row {match.row + 1}"
+        if match.added:
+            status += ", added in " + " ".join(file_commits[sha].commit.short for sha in match.added)
+        if match.deleted:
+            status += ", deleted in " + " ".join(file_commits[sha].commit.short for sha in match.deleted)
+        self.search_status.update(status)
+
+    def _found_file(self, file_no: Optional[int]) -> None:
+        if file_no is not None:
+            self.show_file(file_no)
+
+    def on_file_diff_view_parent_command(self, command: FileDiffView.ParentCommand) -> None:
+        if command.cmd == Cmd.SEARCH:
+            self.open_search()
+        elif command.cmd == Cmd.SEARCH_NEXT:
+            self.search(self.search_query)
+        elif command.cmd == Cmd.SEARCH_PREV:
+            self.search(self.search_query, backwards=True)
+        elif command.cmd == Cmd.FIND_FILE and self.gitdata is not None:
+            self.push_screen(FileFinder(self.gitdata.file_index), self._found_file)
+        elif command.cmd == Cmd.FOCUS_FILE_PREV:
+            self.show_file(self._curr_file - 1)
+        elif command.cmd == Cmd.FOCUS_FILE_NEXT:
+            self.show_file(self._curr_file + 1)
@@ -0,0 +1,37 @@
+from typing import Callable, List
+
+class ViewportModel:
+    """Cursor row and vertical scroll shared by every pane of one file.
+
+    Panes subscribe to it instead of each tracking their own position, so a
+    cursor move is computed once and published to all of them.
+    """
+    def __init__(self, line_count: int):
+        self.line_count = line_count
+        self.cursor_row = 0
+        self.scroll_y = 0
+        self._subscribers: List[Callable[["ViewportModel"], None]] = []
+
+    def subscribe(self, callback: Callable[["ViewportModel"], None]) -> None:
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[["ViewportModel"], None]) -> None:
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def move_cursor(self, rows: int, height: int) -> None:
+        """Moves the cursor by `rows`, scrolling just enough to keep it
+        inside a view of `height` rows."""
+        cursor_row = min(max(0, self.cursor_row + rows), max(0, self.line_count - 1))
+        scroll_y = self.scroll_y
+        if cursor_row < scroll_y:
+            scroll_y = cursor_row
+        elif height > 0 and cursor_row >= scroll_y + height:
+            scroll_y = cursor_row - height + 1
+
+        if (cursor_row, scroll_y) == (self.cursor_row, self.scroll_y):
+            return
+        self.cursor_row = cursor_row
+        self.scroll_y = scroll_y
+        for callback in list(self._subscribers):
+            callback(self)
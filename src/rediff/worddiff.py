@@ -0,0 +1,107 @@
+import re
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from typing import Dict, List, Tuple
+
+from rediff.lines import PLACEHOLDER, PooledLines
+
+ADD = ord('+')
+DELETE = ord('-')
+
+# Lines sharing less than this, as a ratio of their words, are treated as
+# rewritten rather than edited, and get no word highlights
+MIN_SIMILARITY = 0.5
+
+TOKEN = re.compile(r"\w+|\s+|[^\w\s]")
+
+# Changed (start, end) character ranges of a line's text, without its prefix
+Ranges = List[Tuple[int, int]]
+
+# Changed ranges of a (deleted, added) pair of lines, by their pool ids
+PairCache = Dict[Tuple[int, int], Tuple[Ranges, Ranges]]
+
+class WordDiff:
+    """Changed words of one commit's padded lines.
+
+    A change is a block of deleted rows followed by added rows, between
+    context rows; placeholders of other commits may be mixed in. The i-th
+    deleted line is paired with the i-th added one. Blocks are found and
+    pairs diffed only when one of their rows is drawn, so the cost follows
+    what is on screen rather than the size of the file.
+    """
+    def __init__(self, lines: PooledLines, pair_cache: PairCache):
+        self.lines = lines
+        self._pair_cache = pair_cache
+        # Block start row by row, and the deleted and added rows of a block
+        self._block_starts: Dict[int, int] = {}
+        self._blocks: Dict[int, Tuple[List[int], List[int]]] = {}
+
+    def ranges(self, row: int) -> Ranges:
+        kinds = self.lines.kinds
+        if kinds[row] not in (ADD, DELETE):
+            return []
+        start = self._block_starts.get(row)
+        if start is None:
+            start = self._find_block(row)
+        deleted, added = self._blocks[start]
+
+        if kinds[row] == DELETE:
+            index = bisect_left(deleted, row)
+            if index >= len(added):
+                return []
+            return self._pair(row, added[index])[0]
+        index = bisect_left(added, row)
+        if index >= len(deleted):
+            return []
+        return self._pair(deleted[index], row)[1]
+
+    def _find_block(self, row: int) -> int:
+        kinds = self.lines.kinds
+        start = row
+        while start > 0 and kinds[start - 1] in (ADD, DELETE, PLACEHOLDER):
+            start -= 1
+        end = row + 1
+        while end < len(kinds) and kinds[end] in (ADD, DELETE, PLACEHOLDER):
+            end += 1
+
+        deleted = [r for r in range(start, end) if kinds[r] == DELETE]
+        added = [r for r in range(start, end) if kinds[r] == ADD]
+        self._blocks[start] = (deleted, added)
+        for r in deleted + added:
+            self._block_starts[r] = start
+        return start
+
+    def _pair(self, deleted_row: int, added_row: int) -> Tuple[Ranges, Ranges]:
+        key = (self.lines.ids[deleted_row], self.lines.ids[added_row])
+        ranges = self._pair_cache.get(key)
+        if ranges is None:
+            pool_lines = self.lines.pool.lines
+            ranges = self._pair_cache[key] = diff_words(pool_lines[key[0]], pool_lines[key[1]])
+        return ranges
+
+def diff_words(old: str, new: str) -> Tuple[Ranges, Ranges]:
+    """The changed character ranges of old and new, compared word by word."""
+    old_tokens = TOKEN.findall(old)
+    new_tokens = TOKEN.findall(new)
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    if matcher.ratio() < MIN_SIMILARITY:
+        return [], []
+
+    old_offsets = _offsets(old_tokens)
+    new_offsets = _offsets(new_tokens)
+    old_ranges: Ranges = []
+    new_ranges: Ranges = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if i1 < i2:
+            old_ranges.append((old_offsets[i1], old_offsets[i2]))
+        if j1 < j2:
+            new_ranges.append((new_offsets[j1], new_offsets[j2]))
+    return old_ranges, new_ranges
+
+def _offsets(tokens: List[str]) -> List[int]:
+    offsets = [0]
+    for token in tokens:
+        offsets.append(offsets[-1] + len(token))
+    return offsets
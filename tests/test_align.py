@@ -0,0 +1,48 @@
+import unittest
+
+from rediff.align import align, ADD, DELETE
+
+class TestAlign(unittest.TestCase):
+    def test_single_commit(self):
+        aligned, total_length = align([(3, [(ADD, 1, 2)])])
+        self.assertEqual(aligned, [[(ADD, 1, 2)]])
+        self.assertEqual(total_length, 3)
+
+    def test_later_insert_splits_earlier_add(self):
+        # a, b, c added; then x inserted between b and c
+        aligned, total_length = align([
+            (3, [(ADD, 0, 3)]),
+            (4, [(ADD, 2, 3)]),
+        ])
+        self.assertEqual(total_length, 4)
+        self.assertEqual(aligned, [
+            [(ADD, 0, 2), (ADD, 3, 4)],
+            [(ADD, 2, 3)],
+        ])
+
+    def test_earlier_delete_keeps_its_rows(self):
+        # a, b, c with b deleted; then a and c deleted
+        aligned, total_length = align([
+            (3, [(DELETE, 1, 2)]),
+            (2, [(DELETE, 0, 2)]),
+        ])
+        self.assertEqual(total_length, 3)
+        self.assertEqual(aligned, [
+            [(DELETE, 1, 2)],
+            [(DELETE, 0, 1), (DELETE, 2, 3)],
+        ])
+
+    def test_insert_after_deleted_rows(self):
+        # a, b with b deleted; then x added at the end
+        aligned, total_length = align([
+            (2, [(DELETE, 1, 2)]),
+            (2, [(ADD, 1, 2)]),
+        ])
+        self.assertEqual(total_length, 3)
+        self.assertEqual(aligned, [
+            [(DELETE, 1, 2)],
+            [(ADD, 2, 3)],
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
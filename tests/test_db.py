@@ -116,5 +116,438 @@ class TestGitOperations(unittest.TestCase):
         self.assertEqual(patch.line_start, 1)
         self.assertEqual(patch.line_end, 2)
 
+    def test_aligned_content(self):
+        with open(self.file1_path, "a") as file:
+            file.write("a\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Append to File1")
+        with open(self.file1_path, "w") as file:
+            file.write("b\nFILE1 line 1\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Prepend to File1, drop the appended line")
+
+        gd = GitData(self.repo_path, "main")
+        fh = gd.file_histories[self.file1]
+        all_patches = fh.get_all_patches()
+        total_length = fh.get_total_length()
+        self.assertEqual(total_length, 3)
+
+        first, second = [
+            [(p.type, p.line_start, p.line_end) for p in patches]
+            for patches in all_patches.values()]
+        self.assertEqual(first, [(PatchType.ADD, 2, 3)])
+        self.assertEqual(second, [(PatchType.ADD, 0, 1), (PatchType.DELETE, 2, 3)])
+
+        fc1, fc2 = fh.file_commits.values()
+        self.assertEqual(fc1.get_content(all_patches, total_length),
+                         "x\n FILE1 line 1\n+a")
+        self.assertEqual(fc2.get_content(all_patches, total_length),
+                         "+b\n FILE1 line 1\n-a")
+
+    def test_streaming_loader_matches(self):
+        with open(self.file1_path, "a") as file:
+            file.write("a\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Append to File1")
+        moved_path = self.file2_path + ".new"
+        self.repo.git.mv(self.file2_path, moved_path)
+        with open(self.file1_path, "w") as file:
+            file.write("b\nFILE1 line 1\n")
+        crlf_path = os.path.join(self.repo_path, "CRLF")
+        with open(crlf_path, "wb") as file:
+            file.write(b"one\r\ntwo\x0cpage\r\nthree\x0c")
+        self.repo.index.add([self.file1_path, moved_path, crlf_path])
+        self.repo.index.commit("Rename File2, rewrite File1, add a CRLF file")
+        with open(crlf_path, "wb") as file:
+            file.write(b"one\r\n\x0ctwo\r\nthree\x0c\r\n")
+        self.repo.index.add([crlf_path])
+        self.repo.index.commit("Edit the CRLF file")
+
+        expected = GitData(self.repo_path, "main")
+        streamed = GitData(self.repo_path, "main", streaming=True)
+        # Lines split like file content: no '\r', and '\x0c' breaks a line
+        crlf_fc = expected.file_histories["CRLF"].file_commits[expected.commits[-1].hexsha]
+        self.assertEqual(crlf_fc.diff_text,
+                         [" one", "-two", "-page", "-three", "+", "+two", "+three", "+"])
+
+        self.assertEqual([c.hexsha for c in streamed.commits],
+                         [c.hexsha for c in expected.commits])
+        self.assertEqual([c.summary for c in streamed.commits],
+                         [c.summary for c in expected.commits])
+        self.assertEqual(list(streamed.file_histories.keys()),
+                         list(expected.file_histories.keys()))
+        for path, fh in expected.file_histories.items():
+            streamed_fh = streamed.file_histories[path]
+            self.assertEqual(streamed_fh._current_file_name, fh._current_file_name)
+            for sha, fc in fh.file_commits.items():
+                self.assertEqual(streamed_fh.file_commits[sha].diff_text, fc.diff_text)
+                self.assertEqual(streamed_fh.get_aligned().get_content(sha),
+                                 fh.get_aligned().get_content(sha))
+
+    def test_parallel_diff_extraction(self):
+        for line in ("a", "b", "c"):
+            with open(self.file1_path, "a") as file:
+                file.write(f"{line}\n")
+            self.repo.index.add([self.file1_path])
+            self.repo.index.commit(f"Append {line} to File1")
+
+        serial = GitData(self.repo_path, "main")
+        parallel = GitData(self.repo_path, "main", jobs=2)
+        self.assertEqual(len(parallel.diff_cache._patches), 3)
+
+        fh = serial.file_histories[self.file1]
+        parallel_fh = parallel.file_histories[self.file1]
+        for sha, fc in fh.file_commits.items():
+            parallel_fc = parallel_fh.file_commits[sha]
+            self.assertEqual(parallel_fc.diff_text, fc.diff_text)
+            self.assertEqual(parallel_fc._patches, fc._patches)
+        self.assertEqual(parallel_fh.get_total_length(), fh.get_total_length())
+
+    def test_in_process_diff_matches_git(self):
+        with open(self.file1_path, "a") as file:
+            file.write("a\nb\n")
+        bin_path = os.path.join(self.repo_path, "BIN")
+        with open(bin_path, "wb") as file:
+            file.write(b"\x00\x01binary\n")
+        self.repo.index.add([self.file1_path, bin_path])
+        self.repo.index.commit("Append to File1, add a binary file")
+        moved_path = self.file2_path + ".new"
+        self.repo.git.mv(self.file2_path, moved_path)
+        with open(self.file1_path, "w") as file:
+            file.write("b\nFILE1 line 1\nb\n")
+        self.repo.index.add([self.file1_path, moved_path])
+        self.repo.index.commit("Rename File2, rewrite File1")
+
+        expected = GitData(self.repo_path, "main")
+        for algorithm, jobs in (("myers", 1), ("patience", 1), ("histogram", 2)):
+            gd = GitData(self.repo_path, "main", diff_algorithm=algorithm, jobs=jobs)
+            self.assertEqual(list(gd.file_histories.keys()), list(expected.file_histories.keys()))
+            for path, fh in expected.file_histories.items():
+                in_process_fh = gd.file_histories[path]
+                self.assertEqual(in_process_fh.placeholder, fh.placeholder)
+                for sha in fh.file_commits:
+                    self.assertEqual(in_process_fh.get_aligned().get_content(sha),
+                                     fh.get_aligned().get_content(sha))
+            gd.close()
+
+    def test_progress(self):
+        for line in ("a", "b"):
+            with open(self.file1_path, "a") as file:
+                file.write(f"{line}\n")
+            self.repo.index.add([self.file1_path])
+            self.repo.index.commit(f"Append {line} to File1")
+
+        reports = []
+        GitData(self.repo_path, "main",
+                progress=lambda *report: reports.append(report))
+        self.assertEqual(reports, [
+            ("commits", 1, 2),
+            ("commits", 2, 2),
+            ("files", 1, 1),
+        ])
+
+    def test_commit_diff_shared_across_files(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path, self.file2_path])
+        self.repo.index.commit("Append to both files")
+
+        gd = GitData(self.repo_path, "main")
+        self.assertEqual(len(gd.file_histories), 2)
+        # One tree diff per commit, not one per (file, commit) pair
+        self.assertEqual(len(gd.diff_cache._diffs), 1)
+
+        fc2 = list(gd.file_histories[self.file2].file_commits.values())[0]
+        self.assertEqual(fc2.diff_text, [" FILE2 line 1", "+new line"])
+
+    def test_disk_cache_warm_start(self):
+        new_line = "new line"
+        with open(self.file1_path, "a") as file:
+            file.write(f"{new_line}\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Append to File1")
+
+        cold = GitData(self.repo_path, "main", use_cache=True)
+        cold_fc = list(cold.file_histories[self.file1].file_commits.values())[0]
+        self.assertEqual(len(cold.diff_cache._diffs), 1)
+
+        warm = GitData(self.repo_path, "main", use_cache=True)
+        warm_fc = list(warm.file_histories[self.file1].file_commits.values())[0]
+        # Served from .git/rediff/ without running a tree diff
+        self.assertEqual(len(warm.diff_cache._diffs), 0)
+        self.assertEqual(warm_fc.diff_text, cold_fc.diff_text)
+        self.assertEqual(
+            [(p.type, p.line_start, p.line_end) for p in warm_fc.get_patches()],
+            [(PatchType.ADD, 1, 2)])
+
+    def test_prefill_skips_only_fully_cached_commits(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path, self.file2_path])
+        self.repo.index.commit("Append to both files")
+
+        partial = GitData(self.repo_path, "main", use_cache=True, lazy=True)
+        partial.file_histories[self.file1].materialize()
+        partial._flush_disk_cache()
+
+        # FILE2 isn't cached yet, so the commit is still diffed up front
+        gd = GitData(self.repo_path, "main", use_cache=True, lazy=True, jobs=2)
+        gd.prefill_diffs()
+        self.assertEqual(len(gd.diff_cache._diffs), 1)
+        for fh in gd.file_histories.values():
+            fh.materialize()
+        gd._flush_disk_cache()
+
+        cached = GitData(self.repo_path, "main", use_cache=True, lazy=True, jobs=2)
+        cached.prefill_diffs()
+        self.assertEqual(len(cached.diff_cache._diffs), 0)
+
+    def test_lazy_load(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path, self.file2_path])
+        self.repo.index.commit("Append to both files")
+
+        gd = GitData(self.repo_path, "main", lazy=True)
+        self.assertEqual(list(gd.file_histories.keys()), [self.file1, self.file2])
+        self.assertEqual(len(gd.diff_cache._diffs), 0)
+        self.assertFalse(gd.file_histories[self.file1].materialized)
+
+        fh = gd.get_file_history(0)
+        self.assertTrue(fh.materialized)
+        fc = list(fh.file_commits.values())[0]
+        self.assertEqual(fc.diff_text, [" FILE1 line 1", "+new line"])
+
+        # The neighbouring file is prefetched in the background
+        gd._prefetcher.shutdown(wait=True)
+        self.assertTrue(gd.file_histories[self.file2].materialized)
+
+    def test_lazy_load_diffs_one_file(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        moved_path = self.file1_path + ".new"
+        self.repo.git.mv(self.file1_path, moved_path)
+        self.repo.index.add([moved_path, self.file2_path])
+        self.repo.index.commit("Rename File1 and append to both files")
+
+        for algorithm in (None, "myers"):
+            gd = GitData(self.repo_path, "main", lazy=True, diff_algorithm=algorithm)
+            gd.materialize(0)
+            fc = list(gd.file_histories[self.file1].file_commits.values())[0]
+            self.assertEqual(fc.file_name, self.file1 + ".new")
+            self.assertEqual(fc.diff_text, [" FILE1 line 1", "+new line"])
+            # The other file in the commit is neither diffed nor interned
+            self.assertEqual([list(file_diffs) for file_diffs in gd.diff_cache._diffs.values()],
+                             [[self.file1 + ".new"]])
+            self.assertNotIn("FILE2 line 1", gd.line_pool.lines)
+
+            gd.materialize(1)
+            fc2 = list(gd.file_histories[self.file2].file_commits.values())[0]
+            self.assertEqual(fc2.diff_text, [" FILE2 line 1", "+new line"])
+            gd.close()
+
+    def test_aligned_size_limit(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path, self.file2_path])
+        self.repo.index.commit("Append to both files")
+
+        gd = GitData(self.repo_path, "main", lazy=True, max_aligned_size=1)
+        fh1 = gd.get_file_history(0)
+        fh2 = gd.file_histories[self.file2]
+        gd._prefetcher.shutdown(wait=True)
+        fh1.get_aligned().get_lines(next(iter(fh1.file_commits)))
+        # Prefetching the neighbour keeps the viewed file's snapshot
+        self.assertTrue(fh2.materialized)
+        self.assertTrue(fh1.materialized)
+
+        # Viewing the neighbour released the older snapshot
+        gd._touch(fh2)
+        self.assertTrue(fh2.materialized)
+        self.assertFalse(fh1.materialized)
+        self.assertTrue(all(fc.loaded for fc in fh1.file_commits.values()))
+        gd.materialize(0)
+        self.assertTrue(fh1.materialized)
+        self.assertEqual(list(gd._lru), [fh1, fh2])
+
+    def test_memory_budget(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path, self.file2_path])
+        self.repo.index.commit("Append to both files")
+
+        gd = GitData(self.repo_path, "main", lazy=True)
+        fh1 = gd.get_file_history(0)
+        gd._prefetcher.shutdown(wait=True)
+        fh2 = gd.file_histories[self.file2]
+        content = fh2.get_aligned().get_content(next(iter(fh2.file_commits)))
+        self.assertGreater(gd.diff_cache.nbytes, 0)
+        # The prefetched neighbour counts, as the least recently viewed file
+        self.assertEqual(list(gd._lru), [fh2, fh1])
+
+        # Coming back to the first file pushes the neighbour out entirely
+        gd.max_memory = 1
+        gd._touch(fh1)
+        self.assertFalse(fh2.materialized)
+        self.assertFalse(any(fc.loaded for fc in fh2.file_commits.values()))
+        self.assertEqual(fh2.nbytes, 0)
+        self.assertEqual(list(gd._lru), [fh1])
+
+        # and it comes back the same from git, without evicting the file in view
+        gd.materialize(1)
+        self.assertEqual(fh2.get_aligned().get_content(next(iter(fh2.file_commits))), content)
+        self.assertEqual(content, " FILE2 line 1\n+new line")
+        self.assertTrue(fh1.materialized)
+        self.assertEqual(list(gd._lru), [fh2, fh1])
+
+        # The interned text outlives evictions, so it isn't counted against the budget
+        gd.evict(fh1)
+        gd.evict(fh2)
+        self.assertGreater(gd.line_pool.nbytes, 0)
+        self.assertEqual(gd.memory_used(), 0)
+
+    def test_unchanged_commits_share_content(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Append to File1")
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file2_path])
+        self.repo.index.commit("Append to File2")
+
+        for streaming in (False, True):
+            gd = GitData(self.repo_path, "main", streaming=streaming)
+            fc1, fc2 = gd.file_histories[self.file1].file_commits.values()
+            self.assertEqual(fc2.diff_text, [" FILE1 line 1", " new line"])
+            self.assertFalse(fc2.changed)
+            self.assertIs(fc2.diff_text, gd.diff_cache.get_blob(fc1.blob_sha))
+
+            fc1, fc2 = gd.file_histories[self.file2].file_commits.values()
+            self.assertEqual(fc1.diff_text, [" FILE2 line 1"])
+            self.assertEqual(fc2.diff_text, [" FILE2 line 1", "+new line"])
+
+        # File2 is read from its blob, without diffing the first commit
+        gd = GitData(self.repo_path, "main", lazy=True)
+        fh2 = gd.file_histories[self.file2]
+        list(fh2.file_commits.values())[0].load()
+        self.assertEqual(len(gd.diff_cache._diffs), 0)
+
+    def test_file_added_and_deleted_later(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Append to File1")
+        file3_path = os.path.join(self.repo_path, "FILE3")
+        with open(file3_path, "w") as file:
+            file.write("FILE3 line 1\n")
+        self.repo.index.add([file3_path])
+        self.repo.index.remove([self.file2_path], working_tree=True)
+        self.repo.index.commit("Add File3, delete File2")
+        with open(self.file1_path, "a") as file:
+            file.write("last line\n")
+        self.repo.index.add([self.file1_path])
+        self.repo.index.commit("Append to File1 again")
+
+        for streaming in (False, True):
+            gd = GitData(self.repo_path, "main", streaming=streaming)
+            fh3 = gd.file_histories["FILE3"]
+            self.assertEqual([list(fc.diff_text) for fc in fh3.file_commits.values()],
+                             [[], ["+FILE3 line 1"], [" FILE3 line 1"]])
+            fh2 = gd.file_histories[self.file2]
+            self.assertEqual([list(fc.diff_text) for fc in fh2.file_commits.values()],
+                             [[" FILE2 line 1"], ["-FILE2 line 1"], []])
+            self.assertEqual(fh2.get_total_length(), 1)
+
+    def test_empty_added_file(self):
+        empty_path = os.path.join(self.repo_path, "EMPTY")
+        open(empty_path, "w").close()
+        self.repo.index.add([empty_path])
+        self.repo.index.commit("Add an empty file")
+        with open(empty_path, "w") as file:
+            file.write("first line\n")
+        self.repo.index.add([empty_path])
+        self.repo.index.commit("Fill the empty file")
+
+        for options in ({}, {"streaming": True}, {"diff_algorithm": "myers"}):
+            gd = GitData(self.repo_path, "main", **options)
+            fh = gd.file_histories["EMPTY"]
+            self.assertEqual([list(fc.diff_text) for fc in fh.file_commits.values()],
+                             [[], ["+first line"]])
+            gd.close()
+
+    def test_binary_and_oversized_files(self):
+        with open(self.file1_path, "a") as file:
+            file.write("new line\n")
+        bin_path = os.path.join(self.repo_path, "BIN")
+        with open(bin_path, "wb") as file:
+            file.write(b"\x00\x01binary\n")
+        big_path = os.path.join(self.repo_path, "BIG")
+        with open(big_path, "w") as file:
+            file.write("big line\n" * 100)
+        self.repo.index.add([self.file1_path, bin_path, big_path])
+        self.repo.index.commit("Add binary and big files")
+
+        for streaming in (False, True):
+            gd = GitData(self.repo_path, "main", streaming=streaming, max_file_size=500)
+            for fh in gd.file_histories.values():
+                fh.materialize()
+            self.assertIsNone(gd.file_histories[self.file1].placeholder)
+            self.assertEqual(gd.file_histories["BIN"].placeholder, "Binary file")
+            fh = gd.file_histories["BIG"]
+            self.assertTrue(fh.placeholder.startswith("File too large to show"))
+            self.assertEqual(list(fh.file_commits.values())[0].diff_text, [])
+            if not streaming:
+                # Left out of the tree diff instead of read and dropped
+                self.assertEqual(gd.diff_cache.excluded_paths, {"BIG"})
+
+    def test_reload_after_amend(self):
+        for line in ("a", "b"):
+            with open(self.file1_path, "a") as file:
+                file.write(f"{line}\n")
+            self.repo.index.add([self.file1_path])
+            self.repo.index.commit(f"Append {line} to File1")
+
+        gd = GitData(self.repo_path, "main")
+        self.assertFalse(gd.reload())
+        fh1 = gd.file_histories[self.file1]
+        first_commit = gd.commits[0]
+        first_fc = list(fh1.file_commits.values())[0]
+
+        with open(self.file2_path, "a") as file:
+            file.write("new line\n")
+        self.repo.index.add([self.file2_path])
+        # Amend the last commit
+        self.repo.index.commit("Append b to File1 and File2",
+                               parent_commits=self.repo.head.commit.parents)
+
+        self.assertTrue(gd.refs_changed())
+        self.assertTrue(gd.reload())
+        self.assertFalse(gd.refs_changed())
+        self.assertEqual([c.summary for c in gd.commits],
+                         ["Append a to File1", "Append b to File1 and File2"])
+        self.assertIs(gd.commits[0], first_commit)
+
+        # File1's history is patched in place and keeps the surviving commit
+        self.assertIs(gd.file_histories[self.file1], fh1)
+        self.assertIs(list(fh1.file_commits.values())[0], first_fc)
+        self.assertEqual(list(fh1.file_commits.values())[1].diff_text,
+                         [" FILE1 line 1", " a", "+b"])
+        fc2 = list(gd.file_histories[self.file2].file_commits.values())[1]
+        self.assertEqual(fc2.diff_text, [" FILE2 line 1", "+new line"])
+        self.assertEqual(fh1.get_total_length(), 3)
+
 if __name__ == '__main__':
     unittest.main()
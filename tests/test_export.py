@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from git import Repo
+
+from rediff.db import GitData
+from rediff.export import iter_files, iter_html, iter_jsonl
+
+class TestExport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.repo_path = tempfile.mkdtemp()
+        cls.repo = Repo.init(cls.repo_path)
+        cls.repo.git.checkout("-b", "main")
+        file_path = os.path.join(cls.repo_path, "FILE1")
+        with open(file_path, "w") as file:
+            file.write("FILE1 line 1\n")
+        cls.repo.index.add([file_path])
+        cls.repo.index.commit("initial commit")
+        cls.repo.git.checkout("-b", "branch")
+        with open(file_path, "a") as file:
+            file.write("<new line>\n")
+        cls.repo.index.add([file_path])
+        cls.repo.index.commit("Append to File1")
+
+    def test_jsonl(self):
+        gd = GitData(self.repo_path, "main", lazy=True)
+        branch, file1 = [json.loads(line) for line in iter_jsonl(gd)]
+
+        self.assertEqual(branch["type"], "branch")
+        self.assertEqual([c["summary"] for c in branch["commits"]], ["Append to File1"])
+        self.assertEqual(file1["file"], "FILE1")
+        self.assertEqual(file1["total_length"], 2)
+        self.assertEqual(file1["commits"][0]["patches"], [["add", 1, 2]])
+        self.assertEqual(file1["commits"][0]["content"], [" FILE1 line 1", "+<new line>"])
+        # Exported files don't stay loaded
+        self.assertFalse(gd.file_histories["FILE1"].materialized)
+
+    def test_html(self):
+        page = "".join(iter_html(GitData(self.repo_path, "main", lazy=True)))
+        self.assertIn('<td class="add">&lt;new line&gt;</td>', page)
+
+    def test_memory_stays_flat(self):
+        self.repo.git.checkout("-b", "many_files", "main")
+        self.addCleanup(self.repo.git.checkout, "branch")
+        for i in range(4):
+            path = os.path.join(self.repo_path, f"MANY{i}")
+            with open(path, "w") as file:
+                file.write("".join(f"MANY{i} line {j}\n" for j in range(50)))
+            self.repo.index.add([path])
+            self.repo.index.commit(f"Add MANY{i}")
+
+        gd = GitData(self.repo_path, "main", lazy=True, jobs=2)
+        sizes = [(gd.diff_cache.nbytes, gd.line_pool.nbytes, len(gd.line_pool))
+                 for _ in iter_files(gd)]
+        # Each file's diffs, blobs and interned text are dropped once it's exported
+        self.assertEqual(len(sizes), 4)
+        self.assertGreater(min(sizes), (0, 0, 0))
+        self.assertEqual(max(sizes), sizes[0])
+        for _, _, interned in sizes:
+            # The file's 50 lines and the empty line
+            self.assertEqual(interned, 51)
+        self.assertEqual(gd.diff_cache.nbytes, 0)
+        self.assertEqual(gd.line_pool.nbytes, 0)
+        gd.close()
+
+    def test_export_does_not_import_textual(self):
+        code = ("import sys; from rediff.cli import app; "
+                f"app(['export', '-C', {self.repo_path!r}, '--no-cache', 'main'], "
+                "standalone_mode=False); "
+                "assert 'textual' not in sys.modules")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('"type": "file"', result.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
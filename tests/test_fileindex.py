@@ -0,0 +1,35 @@
+import unittest
+
+from rediff.fileindex import FileIndex, FileStats
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        names = ["src/rediff/db.py", "src/rediff/tui.py", "tests/test_db.py", "README.md"]
+        paths = ["src/rediff/db.py", "src/rediff/cli.py", "tests/test_db.py", "README.md"]
+        self.index = FileIndex(paths, names, [
+            FileStats(1), FileStats(3, renamed_from="src/rediff/cli.py"),
+            FileStats(2), FileStats(1, placeholder="Binary file")])
+
+    def test_lookup(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.path(1), "src/rediff/cli.py")
+        self.assertEqual(self.index.position("tests/test_db.py"), 2)
+        self.assertIsNone(self.index.position("src/rediff/tui.py"))
+        self.assertEqual(str(self.index.stats[1]), "3 commits, from src/rediff/cli.py")
+        self.assertEqual(str(self.index.stats[3]), "1 commit, binary file")
+
+    def test_find(self):
+        self.assertEqual(self.index.find(""), [0, 1, 2, 3])
+        self.assertEqual(self.index.find("", limit=2), [0, 1])
+        # Base name matches first, then the shorter path
+        self.assertEqual(self.index.find("db"), [0, 2])
+        self.assertEqual(self.index.find("db.py"), [0, 2])
+        self.assertEqual(self.index.find("rdtui"), [1])
+        self.assertEqual(self.index.find("RDM"), [3])
+        self.assertEqual(self.index.find("xyz"), [])
+        # Narrowed from the previous query, and widened again
+        self.assertEqual(self.index.find("xyzw"), [])
+        self.assertEqual(self.index.find("t"), [2, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from rediff.highlight import Highlighter
+from rediff.lines import LinePool
+
+class TestHighlighter(unittest.TestCase):
+    def test_spans_shared_by_line(self):
+        pool = LinePool()
+        added = pool.encode(["+def foo():", "+    return 1"])
+        kept = pool.encode([" def foo():", "-    return 1"])
+        highlighter = Highlighter(pool)
+
+        python = highlighter.lexer_for("src/a.py")
+        self.assertIsNotNone(python)
+        self.assertEqual(highlighter.lexer_for("b.py"), python)
+        self.assertIsNone(highlighter.lexer_for("README"))
+
+        spans = highlighter.spans(python, added.ids[0])
+        self.assertEqual([(start, end) for start, end, _ in spans], [(0, 3), (4, 7), (7, 8), (8, 9), (9, 10)])
+        self.assertIsNone(spans[0][2].bgcolor)
+        # The same text in another commit, with another prefix, is lexed once
+        self.assertIs(highlighter.spans(python, kept.ids[0]), spans)
+        highlighter.prepare(python, kept.ids)
+        self.assertEqual(len(highlighter._spans), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from rediff.linediff import ALGORITHMS, diff_blobs, diff_ids, matching_blocks
+from rediff.lines import LinePool
+
+def _lcs_length(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) - 1, -1, -1):
+        for j in range(len(b) - 1, -1, -1):
+            lengths[i][j] = (lengths[i + 1][j + 1] + 1 if a[i] == b[j]
+                             else max(lengths[i + 1][j], lengths[i][j + 1]))
+    return lengths[0][0]
+
+class TestLineDiff(unittest.TestCase):
+    def test_diffs_give_back_both_sides(self):
+        rand = random.Random(0)
+        for _ in range(300):
+            a = [rand.randint(0, 5) for _ in range(rand.randint(0, 20))]
+            b = [rand.randint(0, 5) for _ in range(rand.randint(0, 20))]
+            for algorithm in ALGORITHMS:
+                ids, kinds = diff_ids(a, b, algorithm)
+                self.assertEqual([i for i, k in zip(ids, kinds) if k != ord('+')], a)
+                self.assertEqual([i for i, k in zip(ids, kinds) if k != ord('-')], b)
+            blocks = matching_blocks(a, b, "myers")
+            self.assertEqual(sum(length for _, _, length in blocks), _lcs_length(a, b))
+
+    def test_deletes_come_before_adds(self):
+        ids, kinds = diff_ids([1, 2, 3], [1, 4, 3])
+        self.assertEqual(list(ids), [1, 2, 4, 3])
+        self.assertEqual(kinds, b" -+ ")
+
+    def test_unique_lines_anchor_patience_and_histogram(self):
+        a = [0, 0, 7, 0]
+        b = [7, 0, 0, 0]
+        # Myers keeps the most lines, deleting and re-adding the unique one
+        self.assertEqual(matching_blocks(a, b, "myers"), [(0, 1, 2), (3, 3, 1)])
+        for algorithm in ("patience", "histogram"):
+            self.assertEqual(matching_blocks(a, b, algorithm), [(2, 0, 1), (3, 3, 1)])
+
+    def test_diff_blobs(self):
+        pool = LinePool()
+        old = b"a\nb\nc\nd\n"
+        new = b"a\nB\nc\nd"
+        lines = diff_blobs(pool, old, new)
+        self.assertEqual(lines, [" a", "-b", "+B", " c", " d"])
+
+        self.assertEqual(diff_blobs(pool, b"", b"x\ny\n"), ["+x", "+y"])
+        self.assertEqual(diff_blobs(pool, b"x\n", b"x\n"), [" x"])
+        # The common suffix starts mid-line, so the line is diffed whole
+        self.assertEqual(diff_blobs(pool, b"ab\nc\n", b"b\nc\n"), ["-ab", "+b", " c"])
+
+if __name__ == '__main__':
+    unittest.main()
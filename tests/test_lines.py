@@ -0,0 +1,27 @@
+import unittest
+
+from rediff.lines import LinePool, pad
+
+class TestLinePool(unittest.TestCase):
+    def test_lines_are_interned_without_prefix(self):
+        pool = LinePool()
+        first = pool.encode([" a", "+b", "-a"])
+        second = pool.encode([" b", " a"])
+
+        self.assertEqual(first, [" a", "+b", "-a"])
+        self.assertEqual(list(second), [" b", " a"])
+        self.assertEqual(first.ids[0], first.ids[2])
+        self.assertEqual(first.ids[1], second.ids[0])
+        self.assertEqual(len(pool), 3)  # "", "a", "b"
+
+    def test_pad(self):
+        pool = LinePool()
+        lines = pool.encode([" a", "+b", " c"])
+
+        padded = pad(lines, [(1, 3), (2, 4)], 7)
+        self.assertEqual(padded, [" a", "x", "x", "x", "+b", " c", "x"])
+        self.assertEqual(padded[4:6], ["+b", " c"])
+        self.assertEqual(padded.text, " a\nx\nx\nx\n+b\n c\nx")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import json
+import os
+import tempfile
+import unittest
+
+from rediff.profiler import Profiler
+
+class TestProfiler(unittest.TestCase):
+    def test_totals_and_trace(self):
+        profiler = Profiler()
+        with profiler.span("load", file="a.py", commit="1234"):
+            with profiler.span("tree diff", commit="1234"):
+                pass
+        with profiler.span("align", file="a.py"):
+            pass
+        with profiler.span("list commits"):
+            pass
+
+        self.assertEqual(sorted(profiler.totals("file")["a.py"]), ["align", "load"])
+        self.assertEqual(sorted(profiler.totals("commit")["1234"]), ["load", "tree diff"])
+        table = profiler.table()
+        self.assertIn("list commits", table)
+        self.assertIn("a.py", table)
+
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        profiler.write_trace(path)
+        with open(path) as file:
+            events = json.load(file)["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        self.assertEqual([event["name"] for event in spans],
+                         ["tree diff", "load", "align", "list commits"])
+        self.assertEqual(spans[1]["args"], {"file": "a.py", "commit": "1234"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from collections import OrderedDict
+
+from rediff.lines import LinePool
+from rediff.search import SearchIndex
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        pool = LinePool()
+        self.index = SearchIndex(OrderedDict([
+            ("a", pool.encode([" import os", "+def Load():", "x", " pass"])),
+            ("b", pool.encode([" import os", "-def Load():", "+def load_all():", " pass"])),
+            ("c", pool.encode([" import os", "x", " def load_all():", " pass"])),
+        ]))
+
+    def test_find(self):
+        self.assertEqual(self.index.find("def load"), [1, 2])
+        self.assertEqual(self.index.find("os"), [0])
+        self.assertEqual(self.index.find("missing"), [])
+        self.assertEqual(self.index.find(""), [])
+
+    def test_next_match(self):
+        match = self.index.next_match("LOAD(", 0)
+        self.assertEqual((match.row, match.number, match.count), (1, 0, 1))
+        self.assertEqual((match.added, match.deleted), (["a"], ["b"]))
+
+        match = self.index.next_match("def load", 1)
+        self.assertEqual((match.row, match.added, match.deleted), (2, ["b"], []))
+        # Wraps around both ways
+        self.assertEqual(self.index.next_match("def load", 2).row, 1)
+        self.assertEqual(self.index.next_match("def load", 1, backwards=True).row, 2)
+        self.assertIsNone(self.index.next_match("missing", 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from rediff.viewport import ViewportModel
+
+class TestViewportModel(unittest.TestCase):
+    def test_move_cursor_scrolls_and_publishes(self):
+        viewport = ViewportModel(100)
+        published = []
+        viewport.subscribe(lambda vp: published.append((vp.cursor_row, vp.scroll_y)))
+
+        viewport.move_cursor(12, height=10)
+        self.assertEqual(published, [(12, 3)])
+
+        viewport.move_cursor(-5, height=10)
+        self.assertEqual(published[-1], (7, 3))
+
+        viewport.move_cursor(-10, height=10)
+        self.assertEqual(published[-1], (0, 0))
+
+    def test_clamped_move_is_not_published(self):
+        viewport = ViewportModel(3)
+        published = []
+        viewport.subscribe(lambda vp: published.append(vp.cursor_row))
+
+        viewport.move_cursor(10, height=10)
+        viewport.move_cursor(1, height=10)
+        self.assertEqual(published, [2])
+
+if __name__ == '__main__':
+    unittest.main()
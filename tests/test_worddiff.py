@@ -0,0 +1,39 @@
+import unittest
+
+from rediff.lines import LinePool
+from rediff.worddiff import WordDiff, diff_words
+
+class TestWordDiff(unittest.TestCase):
+    def test_diff_words(self):
+        old, new = diff_words("total = price * count", "total = price * quantity")
+        self.assertEqual(old, [(16, 21)])
+        self.assertEqual(new, [(16, 24)])
+        # Rewritten lines aren't highlighted word by word
+        self.assertEqual(diff_words("import os", "return [x for x in y]"), ([], []))
+
+    def test_pairs_rows_of_a_block(self):
+        pool = LinePool()
+        lines = pool.encode([
+            " def f(a):",
+            "-    return a + 1",
+            "x",
+            "-    pass",
+            "+    return a + 2",
+            " ",
+            "+    x = 1",
+        ])
+        pairs = {}
+        word_diff = WordDiff(lines, pairs)
+
+        self.assertEqual(word_diff.ranges(0), [])
+        self.assertEqual(word_diff.ranges(4), [(15, 16)])
+        self.assertEqual(word_diff.ranges(1), [(15, 16)])
+        # The second deleted line has no added partner, nor the lone add
+        self.assertEqual(word_diff.ranges(3), [])
+        self.assertEqual(word_diff.ranges(6), [])
+        self.assertEqual(len(pairs), 1)
+        # Blocks are only looked up for the rows asked about
+        self.assertEqual(sorted(word_diff._blocks), [1, 6])
+
+if __name__ == '__main__':
+    unittest.main()